@@ -0,0 +1,205 @@
+#!/bin/python2
+'''Multi-symbol batch script
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Runs the preprocessing pipeline of visualize.py over many Yahoo Finance
+csv files at once: features are generated for every symbol concurrently
+on a process pool, then the windows of all symbols are embedded with
+t-SNE either jointly, in one embedding, or separately per symbol.
+
+Everything ends up in one .npz file with a row per window:
+
+    symbols     name of every symbol, in input order
+    offsets     rows of symbols[i] are offsets[i]:offsets[i+1]
+    symbol      index into symbols of every row
+    start       index into the series of the first point of the window
+    date        date of that point
+    features    standardized features of the window
+    embedding   t-SNE coordinates of the window
+
+Features are standardized per symbol, as in visualize.py, so a joint
+embedding compares the shape of windows rather than their price level.
+
+For universes whose features do not fit in memory, -M writes them to
+an on-disk FeatureMatrix instead, which the PCA ahead of t-SNE reads a
+chunk of rows at a time; the .npz then has no features array.
+
+With -R the joint embedding is kept in a tsne.reference directory: the
+first run fits and saves it, later runs place their windows in it
+without running t-SNE. Windows the reference already has, by symbol and
+start date, keep their coordinates, so they stay the same between runs.
+'''
+import os
+import glob
+import multiprocessing as mp
+import numpy as np
+from featuregenerator import preprocess as pp
+from featuregenerator.featmatrix import FeatureMatrix
+from tsne import bhtsne
+from tsne.reference import ReferenceEmbedding
+
+MODES = ['joint', 'separate']
+def feature_stage(args):
+    csvpath, k, l, use_relative_err, max_error, column = args
+    features, segd, dates, data = pp.gen_simple_features(csvpath, k, l,
+        use_relative_err, max_error, column)
+    # window i covers segd[i:i+l]
+    starts = segd.indices[:len(features)]
+    return (np.asarray(features, dtype=float), starts,
+        np.array(dates)[starts])
+
+def segment_stage(args):
+    csvpath, k, use_relative_err, max_error, column = args
+    dates, data = pp.csv_import(csvpath, column)
+    segd = pp.segment(data, k, use_relative_err, max_error)
+    return segd, np.array(dates)[segd.indices]
+
+def embed_stage(args):
+    features, perplexity, max_iter = args
+    return bhtsne.calc_tsne(features, PERPLEX=perplexity, MAX_ITER=max_iter)
+
+def run(csvpaths, k, l, outpath, use_relative_err=False,
+        max_error=float('inf'), column='Close', mode='joint',
+        processes=None, perplexity=30, max_iter=1000, matrixdir=None,
+        refdir=None):
+    if mode not in MODES:
+        raise Exception(('Unknown embedding mode ', mode))
+    if refdir is not None and mode != 'joint':
+        raise Exception(('A reference embedding needs mode joint, not ', mode))
+    symbols = [pp.symbol_name(p) for p in csvpaths]
+
+    pool = mp.Pool(processes)
+    try:
+        if matrixdir is None:
+            print("Generating features for " + str(len(csvpaths)) + " symbols")
+            stages = pool.map(feature_stage, [(p, k, l, use_relative_err,
+                max_error, column) for p in csvpaths])
+            features, starts, dates = zip(*stages)
+            counts = [len(f) for f in features]
+            # in memory, the stacked features are read like the matrix
+            matrix = np.vstack(features)
+            pca_method = 'eigh'
+        else:
+            print("Segmenting " + str(len(csvpaths)) + " symbols")
+            stages = pool.map(segment_stage, [(p, k, use_relative_err,
+                max_error, column) for p in csvpaths])
+            segds, dates = zip(*stages)
+
+            print("Writing features to " + matrixdir)
+            matrix = FeatureMatrix.build(matrixdir, segds, l, symbols)
+            counts = np.diff(matrix.offsets)
+            starts = [matrix.start[a:b] for a, b in
+                zip(matrix.offsets[:-1], matrix.offsets[1:])]
+            dates = [d[:n] for d, n in zip(dates, counts)]
+            pca_method = 'incremental'
+
+        offsets = np.r_[0, np.cumsum(counts)]
+        # windows are matched to the reference by symbol and start date,
+        # which unlike the start index don't move as rows are added
+        window_symbol = np.repeat(np.array(symbols), counts)
+        window_date = np.concatenate(dates)
+        if refdir is not None and os.path.exists(os.path.join(refdir, 'meta.json')):
+            print("Placing new windows in the reference embedding in " + refdir)
+            reference = ReferenceEmbedding.load(refdir)
+            known = reference.rows_of(window_symbol, window_date) >= 0
+            print("Keeping " + str(known.sum()) + " windows already in it")
+            embedding = reference.place(matrix, window_symbol, window_date)
+        elif refdir is not None:
+            print("Embedding all windows jointly as the reference in " + refdir)
+            reference = ReferenceEmbedding.fit(matrix, PERPLEX=perplexity,
+                MAX_ITER=max_iter, PCA_METHOD=pca_method,
+                symbol=window_symbol, date=window_date)
+            reference.save(refdir)
+            embedding = reference.Y
+        elif mode == 'joint':
+            print("Embedding all windows jointly")
+            embedding = bhtsne.calc_tsne(matrix, PERPLEX=perplexity,
+                MAX_ITER=max_iter, PCA_METHOD=pca_method)
+        else:
+            print("Embedding the windows of every symbol separately")
+            embedding = np.vstack(pool.map(embed_stage,
+                [(matrix[a:b], perplexity, max_iter)
+                    for a, b in zip(offsets[:-1], offsets[1:])]))
+    finally:
+        pool.close()
+        pool.join()
+
+    columns = dict(
+        symbols=np.array(symbols),
+        offsets=offsets,
+        symbol=np.repeat(np.arange(len(counts)), counts),
+        start=np.concatenate(starts),
+        date=np.concatenate(dates),
+        embedding=embedding)
+    if matrixdir is None:
+        columns['features'] = matrix
+    np.savez(outpath, **columns)
+
+    return embedding
+
+if __name__ == '__main__':
+    import argparse
+
+    aparser = argparse.ArgumentParser(description=
+                '''Generate features and a t-SNE embedding for many Yahoo
+                Finance csv files in one run''')
+    aparser.add_argument(dest='csvFiles',
+        nargs='*',
+        help='Paths to .csv files, every .csv file in data/ if not specified')
+    aparser.add_argument('-k', dest='segmentLength',
+        type=int,
+        required=True,
+        help='ALG. PARAM: Average length of segment')
+    aparser.add_argument('-l', dest='windowLength',
+        type=int,
+        required=True,
+        help='ALG. PARAM: Length of sliding window')
+    aparser.add_argument('-r', dest='relativeError',
+        action='store_true',
+        default=False,
+        help='Use relative square residual error during SEGMENTATION')
+    aparser.add_argument('-e', dest='maxerror',
+        type=float,
+        default=float('inf'),
+        help='Maximum allowed square residual during SEGMENTATION process')
+    aparser.add_argument('-a', dest='column',
+        action='store_const',
+        const='Adj Close',
+        default='Close',
+        help='Use adjusted close prices instead of close prices')
+    aparser.add_argument('-m', dest='mode',
+        choices=MODES,
+        default='joint',
+        help='Embed the windows of all symbols together or per symbol')
+    aparser.add_argument('-o', dest='outFile',
+        type=str,
+        required=True,
+        help='Path of the .npz file to write results to')
+    aparser.add_argument('-j', dest='processes',
+        type=int,
+        default=None,
+        help='Number of worker processes, defaults to the number of CPUs')
+    aparser.add_argument('-p', dest='perplexity',
+        type=float,
+        default=30,
+        help='t-SNE perplexity')
+    aparser.add_argument('-i', dest='iterations',
+        type=int,
+        default=1000,
+        help='t-SNE iterations')
+    aparser.add_argument('-M', dest='matrixDir',
+        type=str,
+        default=None,
+        help='Optional directory to write the features to as a memory-mapped matrix instead of holding them in memory')
+    aparser.add_argument('-R', dest='referenceDir',
+        type=str,
+        default=None,
+        help='Optional directory of a reference embedding to place the windows in, fitted there first if missing')
+
+    args = aparser.parse_args()
+
+    csvpaths = args.csvFiles or sorted(glob.glob(os.path.join(pp.DATA_DIR, '*.csv')))
+    run(csvpaths, args.segmentLength, args.windowLength, args.outFile,
+        args.relativeError, args.maxerror, args.column, args.mode,
+        args.processes, args.perplexity, args.iterations, args.matrixDir,
+        args.referenceDir)
@@ -0,0 +1,2 @@
+__all__ = ['util', 'segmenting', 'tsne_io', 'classify', 'pipeline',
+    'segmenters', 'parallel', 'batchseg', 'reference']
@@ -0,0 +1,89 @@
+#!/bin/python2
+'''Batched segmentation benchmark
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Segments a universe of short synthetic series, a year of daily bars per
+symbol by default, with segmenter.bottom_up_batch over all of them at
+once and with bottom_up per series, the way preprocess.segment runs it
+with a PrefixSumResidual, and with bottom_up_array per series with the
+module residual functions, whose merges bottom_up_batch reproduces.
+
+Reports the time of every method, the speedup of the batch over each and
+the number of series where the breakpoints differ from bottom_up_array.
+
+Run from the repository root with
+    python -m benchmarks.batchseg [-k SEGMENTLENGTH] [-n SERIES]
+        [-p POINTS] [-r]
+'''
+
+import numpy as np
+from featuregenerator import segmenter as sgt
+from benchmarks import util
+
+def universe(count, points, seed=0):
+    # geometric random walks of points +- 25% each
+    rng = np.random.RandomState(seed)
+    lengths = rng.randint(points - points/4, points + points/4 + 1, count)
+    return [(100 * np.exp(np.cumsum(rng.randn(n) * 0.01))).tolist()
+        for n in lengths]
+
+def per_series(series, k, relative):
+    segds = []
+    for data in series:
+        engine = sgt.PrefixSumResidual(data)
+        calc_error = (engine.relative_sqr_residual if relative
+            else engine.sqr_residual)
+        segds.append(sgt.bottom_up(data, k, calc_error=calc_error))
+    return segds
+
+def per_series_array(series, k, relative):
+    calc_error = sgt.relative_sqr_residual if relative else sgt.sqr_residual
+    return [sgt.bottom_up_array(data, k, calc_error) for data in series]
+
+def batched(series, k, relative):
+    calc_error = sgt.relative_sqr_residual if relative else sgt.sqr_residual
+    offsets = np.r_[0, np.cumsum([len(data) for data in series])]
+    return sgt.bottom_up_batch(np.concatenate(series), offsets, k, calc_error)
+
+def run(k, count, points, relative):
+    series = universe(count, points)
+    print '%d series of about %d points, k=%d' % (count, points, k)
+
+    bseconds, (indices, values, bounds) = util.timed(batched, series, k, relative)
+    seconds, segds = util.timed(per_series, series, k, relative)
+    aseconds, asegds = util.timed(per_series_array, series, k, relative)
+
+    differ = sum(indices[bounds[s]:bounds[s+1]].tolist() != [i for i, v in segd]
+        for s, segd in enumerate(asegds))
+
+    print '%-32s %9.3f' % ('bottom_up_batch', bseconds)
+    print '%-32s %9.3f %7.2fx' % ('bottom_up per series', seconds,
+        seconds / bseconds)
+    print '%-32s %9.3f %7.2fx' % ('bottom_up_array per series', aseconds,
+        aseconds / bseconds)
+    print 'series differing from bottom_up_array: %d' % differ
+
+if __name__ == '__main__':
+    import argparse
+
+    aparser = argparse.ArgumentParser(description=
+                'Benchmark bottom_up_batch against bottom_up per series')
+    aparser.add_argument('-k', dest='segmentLength',
+        type=int,
+        default=10,
+        help='ALG. PARAM: Average length of segment')
+    aparser.add_argument('-n', dest='count',
+        type=int,
+        default=2000,
+        help='Number of series')
+    aparser.add_argument('-p', dest='points',
+        type=int,
+        default=252,
+        help='Average number of points per series')
+    aparser.add_argument('-r', dest='relative',
+        action='store_true',
+        default=False,
+        help='Use the relative square residual')
+
+    args = aparser.parse_args()
+    run(args.segmentLength, args.count, args.points, args.relative)
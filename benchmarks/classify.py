@@ -0,0 +1,111 @@
+#!/bin/python2
+'''Window classifier benchmark
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Compares the per window classify loop this repository used to have
+against the vectorized featextract.classify (with and without the
+conversion of its list of (index,value) pairs) and the streaming
+featextract.stream_classify, on the 16k point sp500 series and a
+synthetic random walk, checking that all of them give the same labels.
+
+The loop builds a tuple per window, so it is only run on series of at
+most LOOPLIMIT points.
+
+Run from the repository root with
+    python -m benchmarks.classify [-l WINDOWLENGTH] [-s POINTS] [-x LOOPLIMIT]
+'''
+
+import os
+import numpy as np
+from featuregenerator import preprocess as pp
+from featuregenerator import featextract as fex
+from benchmarks import util
+
+def loop_classify(segd, l):
+    # featextract.classify before it was vectorized
+    inds, vals = zip(*segd)
+    segs = [vals[i:i+l] for i in xrange(len(vals)-l+1)]
+
+    classes = [0] * len(segs)
+
+    for i in xrange(len(segs)):
+        s = segs[i]
+
+        inc = s[-1] - s[0]
+        top = max(s)
+        bot = min(s)
+        revTOP = top > s[-1] and top > s[0]
+        revBOT = bot < s[-1] and bot < s[0]
+        if revTOP and revBOT:
+            continue
+        elif revTOP:
+            classes[i] = 1
+            continue
+        elif revBOT:
+            classes[i] = 2
+            continue
+        elif inc > 0:
+            classes[i] = 3
+        elif inc < 0:
+            classes[i] = 4
+
+    return classes
+
+def random_walk(n, seed=0):
+    steps = np.random.RandomState(seed).randn(n)
+    return 100 + np.cumsum(steps)
+
+def compare(name, data, l, loop_limit):
+    segd = list(enumerate(data))
+
+    t_vec, labels = util.timed(fex.classify, segd, l)
+    # the same without converting the list of pairs
+    t_kernel = util.timed(fex.classify_windows,
+        fex.sliding_windows(data, l))[0]
+    t_stream, streamed = util.timed(
+        lambda: np.fromiter(fex.stream_classify(data, l), dtype=int))
+    same = (labels == streamed).all()
+
+    if len(data) <= loop_limit:
+        t_loop, looped = util.timed(loop_classify, segd, l)
+        same = same and (labels == looped).all()
+        loop = '%10.3f %7.1fx' % (t_loop, t_loop / t_vec)
+    else:
+        loop = '%10s %8s' % ('-', '-')
+
+    print '%-28s %9d %s %10.3f %10.3f %10.3f %6s' % (
+        name, len(data), loop, t_vec, t_kernel, t_stream, same)
+
+def run(l, synthetic, loop_limit):
+    print '%-28s %9s %10s %8s %10s %10s %10s %6s' % ('series', 'points',
+        'loop s', 'speedup', 'vector s', 'windows s', 'stream s', 'same')
+
+    path = util.data_files('yahoo-sp500-*.csv')[0]
+    with open(path, 'rb') as csvfile:
+        dates, data = pp.csv_import(csvfile)
+    compare(os.path.basename(path), data, l, loop_limit)
+
+    for n in (10**6, synthetic):
+        if 0 < n <= synthetic:
+            compare('random walk', random_walk(n).tolist(), l, loop_limit)
+
+if __name__ == '__main__':
+    import argparse
+
+    aparser = argparse.ArgumentParser(description=
+                'Benchmark the window classifier implementations')
+    aparser.add_argument('-l', dest='windowLength', 
+        type=int,
+        default=20,
+        help='ALG. PARAM: Length of sliding window')
+    aparser.add_argument('-s', dest='synthetic', 
+        type=int,
+        default=10**7,
+        help='Length of the largest synthetic random walk, 0 to skip it')
+    aparser.add_argument('-x', dest='loopLimit', 
+        type=int,
+        default=10**6,
+        help='Longest series to run the per window loop on')
+
+    args = aparser.parse_args()
+    run(args.windowLength, args.synthetic, args.loopLimit)
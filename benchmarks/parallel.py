@@ -0,0 +1,86 @@
+#!/bin/python2
+'''Parallel segmentation benchmark
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Compares segmenter.parallel_bottom_up against single process bottom_up
+on the bundled Yahoo Finance data and a synthetic random walk. The
+bundled series are only a few thousand points, so they are cut into
+small chunks to exercise the stitching.
+
+Reports the time and the number of breakpoints of both, the total
+residual of parallel_bottom_up relative to bottom_up's and the fraction
+of bottom_up's breakpoints that parallel_bottom_up also has.
+
+Run from the repository root with
+    python -m benchmarks.parallel [-k SEGMENTLENGTH] [-c CHUNKSIZE]
+        [-j PROCESSES] [-s POINTS] [-r]
+'''
+
+import numpy as np
+from featuregenerator import segmenter as sgt
+from benchmarks import util
+from benchmarks.segmenters import series, random_walk, total_residual
+
+def compare(name, data, k, relative, processes, chunk_size):
+    engine = sgt.PrefixSumResidual(data)
+    if relative:
+        calc_error = engine.relative_sqr_residual
+        residuals = engine.relative_sqr_residuals
+    else:
+        calc_error = engine.sqr_residual
+        residuals = engine.sqr_residuals
+
+    seconds, segd = util.timed(sgt.bottom_up_array, data, k, calc_error)
+    pseconds, psegd = util.timed(sgt.parallel_bottom_up, data, k,
+        calc_error, processes=processes, chunk_size=chunk_size)
+
+    inds = np.array([i for i, v in segd])
+    pinds = np.array([i for i, v in psegd])
+    shared = len(np.intersect1d(inds, pinds)) / float(len(inds))
+    ratio = total_residual(psegd, residuals) / total_residual(segd, residuals)
+
+    print '%-24s %9d %9.3f %9.3f %7.2fx %8d %8d %9.3f %8.1f%%' % (
+        name, len(data), seconds, pseconds, seconds / pseconds,
+        len(segd), len(psegd), ratio, 100 * shared)
+
+def run(k, chunk_size, processes, synthetic, relative):
+    print '%-24s %9s %9s %9s %8s %8s %8s %9s %9s' % ('series', 'points',
+        'serial', 'parallel', 'speedup', 'breaks', 'pbreaks', 'residual',
+        'shared')
+    for name, data in series():
+        compare(name, data, k, relative, processes, chunk_size)
+
+    if synthetic > 0:
+        # chunks of the walk as long as the bundled series
+        compare('random walk', random_walk(synthetic), k, relative,
+            processes, max(chunk_size, synthetic / 8))
+
+if __name__ == '__main__':
+    import argparse
+
+    aparser = argparse.ArgumentParser(description=
+                'Benchmark parallel_bottom_up against bottom_up')
+    aparser.add_argument('-k', dest='segmentLength',
+        type=int,
+        default=10,
+        help='ALG. PARAM: Average length of segment')
+    aparser.add_argument('-c', dest='chunkSize',
+        type=int,
+        default=2000,
+        help='Points per chunk of the bundled series')
+    aparser.add_argument('-j', dest='processes',
+        type=int,
+        default=None,
+        help='Number of worker processes, defaults to the number of CPUs')
+    aparser.add_argument('-s', dest='synthetic',
+        type=int,
+        default=1000000,
+        help='Length of the synthetic random walk, 0 to skip it')
+    aparser.add_argument('-r', dest='relative',
+        action='store_true',
+        default=False,
+        help='Use the relative square residual')
+
+    args = aparser.parse_args()
+    run(args.segmentLength, args.chunkSize, args.processes, args.synthetic,
+        args.relative)
@@ -0,0 +1,342 @@
+#!/bin/python2
+'''Pipeline benchmark suite
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Times every stage of the preprocessing and embedding pipeline
+    csv import, segmentation with each error function, duplicate
+    removal, feature extraction with each feature function,
+    standardization, PCA and t-SNE embedding
+on the bundled Yahoo Finance data and on synthetic random walks, and
+reports wall time, peak memory growth and, over the synthetic sizes,
+the scaling exponent b of seconds ~ points^b.
+
+On real data every stage gets the output of the one before it. On a
+synthetic walk of n points every stage gets an input of n points of its
+own kind instead (the walk as a segmentation, features of its n windows)
+so the exponents are measured over the same sizes for every stage.
+Stages are skipped on inputs larger than their entry in LIMITS, which
+keeps a default run within a few GB of memory; -a lifts the limits.
+
+Every measurement runs in a forked process. Results are written as JSON
+and two result files can be compared, flagging regressions:
+
+    python -m benchmarks.pipeline run [-s SIZES] [-o OUT.json]
+    python -m benchmarks.pipeline compare BASE.json NEW.json [-t THRESHOLD]
+'''
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import platform
+import numpy as np
+from featuregenerator import preprocess as pp
+from featuregenerator import segmenter as sgt
+from featuregenerator import featextract as fex
+from tsne import calc_tsne
+from tsne import bhtsne
+from benchmarks import util
+
+# largest input every stage is run on by default
+LIMITS = {
+    'csv_import': 10**6,
+    'segment_sqr': 10**6,
+    'segment_relative': 10**6,
+    'remove_duplicates': 10**7,
+    'standardize': 10**6,
+    'pca': 10**6,
+    'embedding': 2*10**4,
+}
+FEATURE_LIMIT = 10**6
+
+FEATURES = [
+    fex.compute_simple_trend_features,
+    fex.compute_jimmy_and_ricky_simple_trend_features,
+    fex.compute_jimmy_and_ricky_acf_features,
+    fex.compute_jimmy_and_ricky_fft_acf_features,
+]
+
+class Inputs(object):
+    '''
+    Inputs of every stage for one series, built on first use
+    '''
+
+    def __init__(self, builders):
+        self.builders = builders
+        self.built = {}
+
+    def __getitem__(self, kind):
+        if kind not in self.built:
+            self.built[kind] = self.builders[kind](self)
+        return self.built[kind]
+
+def bundled_inputs(path, k, l):
+    def segd(inputs):
+        data = inputs['data']
+        residuals = sgt.PrefixSumResidual(data)
+        return sgt.bottom_up(data, k, calc_error=residuals.sqr_residual)
+
+    return Inputs({
+        'csv': lambda inputs: path,
+        'data': lambda inputs: pp.csv_import(path)[1],
+        'segd': segd,
+        'deduped': lambda inputs: deduplicated(inputs['segd']),
+        'features': lambda inputs: fex.extract_features(inputs['deduped'], l),
+        'raw': lambda inputs: raw_features(inputs['deduped'], l),
+    })
+
+def synthetic_inputs(n, l, workdir, seed=0):
+    def data(inputs):
+        # geometric walk, so prices stay positive for the relative error
+        steps = np.random.RandomState(seed).randn(n) * 0.01
+        return (100 * np.exp(np.cumsum(steps))).tolist()
+
+    def csv(inputs):
+        path = os.path.join(workdir, 'walk-%d.csv' % n)
+        write_csv(path, inputs['data'])
+        return path
+
+    def segd(inputs):
+        # rounding to cents leaves some consecutive duplicates
+        return list(enumerate(np.round(inputs['data'], 2).tolist()))
+
+    return Inputs({
+        'csv': csv,
+        'data': data,
+        'segd': segd,
+        'deduped': lambda inputs: deduplicated(inputs['segd']),
+        'features': lambda inputs: fex.standardize(inputs['raw']),
+        'raw': lambda inputs: raw_features(inputs['deduped'], l),
+    })
+
+def deduplicated(segd):
+    segd = list(segd)
+    pp.remove_consecutive_duplicates(segd)
+    return segd
+
+def raw_features(segd, l):
+    garbage, vals = zip(*segd)
+    return np.asarray(fex.compute_windows(vals, l,
+        fex.compute_jimmy_and_ricky_acf_features))
+
+def write_csv(path, data):
+    # Yahoo layout, newest row first, every price column the close
+    n = len(data)
+    dates = (np.datetime64('1970-01-01') + np.arange(n)).astype(str)
+    prices = np.char.mod('%.6f', data)
+    with open(path, 'wb') as out:
+        out.write('Date,Open,High,Low,Close,Volume,Adj Close\n')
+        for i in xrange(n - 1, -1, -1):
+            p = prices[i]
+            out.write('%s,%s,%s,%s,%s,0,%s\n' % (dates[i], p, p, p, p, p))
+
+def stages(k, l, iterations):
+    '''
+    List of (name, input kind, limit, function of the input)
+    '''
+    def segment(calc_error):
+        def run(data):
+            residuals = sgt.PrefixSumResidual(data)
+            return sgt.bottom_up(data, k,
+                calc_error=getattr(residuals, calc_error))
+        return run
+
+    def extract(compute_feature):
+        return lambda segd: fex.extract_features(segd, l, compute_feature)
+
+    found = [
+        ('csv_import', 'csv', pp.csv_import),
+        ('segment_sqr', 'data', segment('sqr_residual')),
+        ('segment_relative', 'data', segment('relative_sqr_residual')),
+        ('remove_duplicates', 'segd', deduplicated),
+    ]
+    found.extend(('features_' + f.__name__[len('compute_'):], 'deduped', extract(f))
+        for f in FEATURES)
+    found.extend([
+        ('standardize', 'raw', fex.standardize),
+        ('pca', 'features', lambda X: calc_tsne.PCA(X, 30)),
+        ('embedding', 'features',
+            lambda X: bhtsne.calc_tsne(X, MAX_ITER=iterations, SEED=0)),
+    ])
+    return [(name, kind, LIMITS.get(name, FEATURE_LIMIT), func)
+        for name, kind, func in found]
+
+def measure(func, arg, repeat):
+    # best time and worst memory of repeat forked runs
+    runs = [util.peak_memory(util.silenced, func, arg) for i in xrange(repeat)]
+    return min(s for s, kb in runs), max(kb for s, kb in runs)
+
+def run_series(name, inputs, points, k, l, repeat, iterations, unlimited):
+    results = []
+    for stage, kind, limit, func in stages(k, l, iterations):
+        if points > limit and not unlimited:
+            continue
+        seconds, peak = measure(func, inputs[kind], repeat)
+        print '%-28s %-48s %9d %10.3f %10d' % (name, stage, points,
+            seconds, peak)
+        results.append({'series': name, 'stage': stage, 'points': points,
+            'seconds': seconds, 'peak_kb': peak})
+    return results
+
+def scaling(results):
+    '''
+    Least squares exponents of seconds and peak memory against points
+    over the synthetic series, per stage
+    '''
+    exponents = {}
+    for stage in sorted(set(r['stage'] for r in results)):
+        rows = [r for r in results
+            if r['stage'] == stage and r['series'] == 'random walk']
+        fits = {}
+        for key in ('seconds', 'peak_kb'):
+            pts = [(r['points'], r[key]) for r in rows if r[key] > 0]
+            if len(pts) >= 2:
+                x, y = np.log(zip(*pts))
+                fits[key] = np.polyfit(x, y, 1)[0]
+        exponents[stage] = fits
+    return exponents
+
+def run(sizes, k, l, repeat, iterations, outpath, unlimited):
+    print '%-28s %-48s %9s %10s %10s' % ('series', 'stage', 'points',
+        'seconds', 'peak kB')
+
+    results = []
+    for path in util.data_files():
+        inputs = bundled_inputs(path, k, l)
+        results.extend(run_series(os.path.basename(path), inputs,
+            len(inputs['data']), k, l, repeat, iterations, unlimited))
+
+    workdir = tempfile.mkdtemp()
+    try:
+        for n in sizes:
+            results.extend(run_series('random walk', synthetic_inputs(n, l, workdir),
+                n, k, l, repeat, iterations, unlimited))
+    finally:
+        shutil.rmtree(workdir)
+
+    exponents = scaling(results)
+    print
+    print '%-48s %10s %10s' % ('stage', 'time exp', 'memory exp')
+    for stage, fits in sorted(exponents.items()):
+        print '%-48s %10s %10s' % (stage,
+            '%.2f' % fits['seconds'] if 'seconds' in fits else '-',
+            '%.2f' % fits['peak_kb'] if 'peak_kb' in fits else '-')
+
+    report = {
+        'meta': {'k': k, 'l': l, 'repeat': repeat, 'iterations': iterations,
+            'sizes': sizes, 'time': time.time(),
+            'python': platform.python_version(), 'numpy': np.__version__},
+        'results': results,
+        'scaling': exponents}
+    if outpath is not None:
+        with open(outpath, 'w') as out:
+            json.dump(report, out, indent=2, sort_keys=True)
+    return report
+
+def compare(basepath, newpath, threshold, min_seconds, min_kb):
+    '''
+    Prints every measurement of both runs side by side, flagging those
+    that got more than threshold slower or bigger. Measurements below
+    min_seconds or min_kb in both runs are too noisy to flag.
+    Returns the number of regressions
+    '''
+    with open(basepath) as f:
+        base = json.load(f)
+    with open(newpath) as f:
+        new = json.load(f)
+
+    def keyed(report):
+        return dict(((r['series'], r['stage'], r['points']), r)
+            for r in report['results'])
+    base, new = keyed(base), keyed(new)
+
+    print '%-28s %-48s %9s %9s %9s %9s %9s  %s' % ('series', 'stage',
+        'points', 'base s', 'new s', 'ratio', 'mem ratio', '')
+    regressions = 0
+    for key in sorted(set(base) & set(new)):
+        b, n = base[key], new[key]
+        flags = []
+        time_ratio = n['seconds'] / max(b['seconds'], 1e-9)
+        mem_ratio = float(max(n['peak_kb'], 1)) / max(b['peak_kb'], 1)
+        if time_ratio > 1 + threshold and n['seconds'] >= min_seconds:
+            flags.append('SLOWER')
+        if mem_ratio > 1 + threshold and n['peak_kb'] >= min_kb:
+            flags.append('BIGGER')
+        regressions += len(flags)
+        print '%-28s %-48s %9d %9.3f %9.3f %9.2f %9.2f  %s' % (key + (
+            b['seconds'], n['seconds'], time_ratio, mem_ratio, ' '.join(flags)))
+
+    for key in sorted(set(base) ^ set(new)):
+        print '%-28s %-48s %9d only in %s' % (key + (
+            'base' if key in base else 'new',))
+
+    print '%d regressions' % regressions
+    return regressions
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    aparser = argparse.ArgumentParser(description=
+                'Benchmark every stage of the pipeline')
+    commands = aparser.add_subparsers(dest='command')
+
+    runparser = commands.add_parser('run',
+        help='Run the benchmarks')
+    runparser.add_argument('-s', dest='sizes',
+        type=int,
+        nargs='*',
+        default=[10**4, 10**5, 10**6, 10**7],
+        help='Lengths of the synthetic random walks')
+    runparser.add_argument('-k', dest='segmentLength',
+        type=int,
+        default=10,
+        help='ALG. PARAM: Average length of segment')
+    runparser.add_argument('-l', dest='windowLength',
+        type=int,
+        default=20,
+        help='ALG. PARAM: Length of sliding window')
+    runparser.add_argument('-n', dest='repeat',
+        type=int,
+        default=1,
+        help='Number of timed runs, the best is reported')
+    runparser.add_argument('-i', dest='iterations',
+        type=int,
+        default=100,
+        help='t-SNE iterations')
+    runparser.add_argument('-a', dest='unlimited',
+        action='store_true',
+        default=False,
+        help='Run every stage on every size, ignoring LIMITS')
+    runparser.add_argument('-o', dest='outFile',
+        type=str,
+        default=None,
+        help='Path to write the results to as JSON')
+
+    compareparser = commands.add_parser('compare',
+        help='Compare the results of two runs')
+    compareparser.add_argument(dest='baseFile',
+        help='JSON results of the reference run')
+    compareparser.add_argument(dest='newFile',
+        help='JSON results of the run to check')
+    compareparser.add_argument('-t', dest='threshold',
+        type=float,
+        default=0.1,
+        help='Relative slowdown or growth flagged as a regression')
+    compareparser.add_argument('-m', dest='minSeconds',
+        type=float,
+        default=0.01,
+        help='Timings below this many seconds are not flagged')
+    compareparser.add_argument('-b', dest='minKB',
+        type=int,
+        default=1024,
+        help='Memory growth below this many kB is not flagged')
+
+    args = aparser.parse_args()
+    if args.command == 'run':
+        run(args.sizes, args.segmentLength, args.windowLength, args.repeat,
+            args.iterations, args.outFile, args.unlimited)
+    else:
+        sys.exit(1 if compare(args.baseFile, args.newFile, args.threshold,
+            args.minSeconds, args.minKB) else 0)
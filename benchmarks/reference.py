@@ -0,0 +1,80 @@
+#!/bin/python2
+'''Reference embedding benchmark
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Freezes a tsne.reference.ReferenceEmbedding over the windows of the
+bundled Yahoo Finance data with every PCA method, once from the
+features in memory and once from the same features in an on-disk
+FeatureMatrix, with the same given coordinates so no t-SNE is run.
+
+Reports the time and peak memory growth of both, and the largest
+difference between their reduced reference points and between the
+coordinates they place a sample of the windows at, which should be
+at floating point tolerance.
+
+Run from the repository root with
+    python -m benchmarks.reference [-k SEGMENTLENGTH] [-l WINDOWLENGTH]
+        [-m METHOD ...]
+'''
+
+import shutil
+import tempfile
+import numpy as np
+from featuregenerator import preprocess as pp
+from featuregenerator.featmatrix import FeatureMatrix
+from tsne.reference import ReferenceEmbedding
+from benchmarks import util
+
+METHODS = ['eigh', 'randomized', 'incremental']
+
+def freeze(raw, Y, method):
+    return ReferenceEmbedding.freeze(raw, Y, PCA_METHOD=method)
+
+def run(k, l, methods):
+    segds = [pp.segment(pp.csv_import(path)[1], k)
+        for path in util.data_files()]
+    workdir = tempfile.mkdtemp()
+    try:
+        matrix = util.silenced(FeatureMatrix.build, workdir, segds, l)
+        dense = matrix[:]
+        Y = np.random.RandomState(0).randn(len(matrix), 2)
+        sample = dense[::max(1, len(dense) / 1000)]
+        print '%d windows of %d features, k=%d, l=%d' % (len(matrix),
+            matrix.shape[1], k, l)
+
+        for method in methods:
+            seconds, memory = util.peak_memory(freeze, dense, Y, method)
+            mseconds, mmemory = util.peak_memory(freeze, matrix, Y, method)
+            a = freeze(dense, Y, method)
+            b = freeze(matrix, Y, method)
+            # principal axes are only defined up to their sign
+            signs = np.sign((a.pca_axes * b.pca_axes).sum(axis=0))
+            reduced = np.abs(a.X - b.X * signs).max()
+            placed = np.abs(a.transform(sample) - b.transform(sample)).max()
+            print '%-12s array %7.3fs %8d kB  matrix %7.3fs %8d kB  max diff %.1e %.1e' % (
+                method, seconds, memory, mseconds, mmemory, reduced, placed)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    import argparse
+
+    aparser = argparse.ArgumentParser(description=
+                '''Benchmark freezing a reference embedding from features in
+                memory and in a FeatureMatrix with every PCA method''')
+    aparser.add_argument('-k', dest='segmentLength',
+        type=int,
+        default=5,
+        help='ALG. PARAM: Average length of segment')
+    aparser.add_argument('-l', dest='windowLength',
+        type=int,
+        default=5,
+        help='ALG. PARAM: Length of sliding window')
+    aparser.add_argument('-m', dest='methods',
+        choices=METHODS,
+        nargs='+',
+        default=METHODS,
+        help='PCA methods to freeze with')
+
+    args = aparser.parse_args()
+    run(args.segmentLength, args.windowLength, args.methods)
@@ -0,0 +1,86 @@
+#!/bin/python2
+'''Segmentation algorithm benchmark
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Compares every segmenter in segmenter.SEGMENTERS against bottom_up on
+the bundled Yahoo Finance data and a synthetic random walk, with
+residuals from a PrefixSumResidual. Reports the time, the number of
+breakpoints and the total residual of the lines between consecutive
+breakpoints, also relative to bottom_up.
+
+Run from the repository root with
+    python -m benchmarks.segmenters [-k SEGMENTLENGTH] [-s POINTS] [-r]
+'''
+
+import os
+import numpy as np
+from featuregenerator import preprocess as pp
+from featuregenerator import segmenter as sgt
+from benchmarks import util
+
+def series():
+    # yields (name, data) for every bundled csv
+    for path in util.data_files():
+        with open(path, 'rb') as csvfile:
+            dates, data = pp.csv_import(csvfile)
+        yield os.path.basename(path), list(data)
+
+def random_walk(n, seed=0):
+    # geometric, so prices stay positive for the relative error
+    steps = np.random.RandomState(seed).randn(n) * 0.01
+    return (100 * np.exp(np.cumsum(steps))).tolist()
+
+def total_residual(segd, residuals):
+    inds = np.array([i for i, v in segd])
+    return residuals(inds[:-1], inds[1:]).sum()
+
+def compare(name, data, k, relative):
+    engine = sgt.PrefixSumResidual(data)
+    if relative:
+        calc_error = engine.relative_sqr_residual
+        residuals = engine.relative_sqr_residuals
+    else:
+        calc_error = engine.sqr_residual
+        residuals = engine.sqr_residuals
+
+    base = None
+    for method in ['bottom_up'] + sorted(m for m in sgt.SEGMENTERS if m != 'bottom_up'):
+        seconds, segd = util.timed(sgt.SEGMENTERS[method], data, k,
+            calc_error=calc_error)
+        res = total_residual(segd, residuals)
+        if base is None:
+            base = (seconds, len(segd), res)
+        print '%-24s %-16s %8d %9.3f %7.2fx %8d %7.2fx %12.6g %7.2fx' % (
+            name, method, len(data), seconds, base[0] / seconds,
+            len(segd), float(len(segd)) / base[1], res, res / base[2])
+
+def run(k, synthetic, relative):
+    print '%-24s %-16s %8s %9s %8s %8s %8s %12s %8s' % ('series', 'method',
+        'points', 'seconds', 'speedup', 'breaks', 'ratio', 'residual', 'ratio')
+
+    for name, data in series():
+        compare(name, data, k, relative)
+
+    if synthetic > 0:
+        compare('random walk', random_walk(synthetic), k, relative)
+
+if __name__ == '__main__':
+    import argparse
+
+    aparser = argparse.ArgumentParser(description=
+                'Benchmark the segmentation algorithms against bottom_up')
+    aparser.add_argument('-k', dest='segmentLength', 
+        type=int,
+        default=10,
+        help='ALG. PARAM: Average length of segment')
+    aparser.add_argument('-s', dest='synthetic', 
+        type=int,
+        default=200000,
+        help='Length of the synthetic random walk, 0 to skip it')
+    aparser.add_argument('-r', dest='relative',
+        action='store_true',
+        default=False,
+        help='Use the relative square residual')
+
+    args = aparser.parse_args()
+    run(args.segmentLength, args.synthetic, args.relative)
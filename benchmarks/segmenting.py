@@ -0,0 +1,75 @@
+#!/bin/python2
+'''Segmenter benchmark
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Compares the llist/heapdict bottom_up against the array backed
+bottom_up_array on the bundled Yahoo Finance data, plus a synthetic
+random walk long enough for the per-pair memory to show.
+
+Run from the repository root with
+    python -m benchmarks.segmenting [-k SEGMENTLENGTH] [-n REPEAT] [-s POINTS]
+'''
+
+import os
+import numpy as np
+from featuregenerator import preprocess as pp
+from featuregenerator import segmenter as sgt
+from benchmarks import util
+
+def series():
+    # yields (name, data) for every bundled csv
+    for path in util.data_files():
+        with open(path, 'rb') as csvfile:
+            dates, data = pp.csv_import(csvfile)
+        yield os.path.basename(path), data
+
+def random_walk(n, seed=0):
+    steps = np.random.RandomState(seed).randn(n)
+    return (100 + np.cumsum(steps)).tolist()
+
+def compare(name, data, k, repeat):
+    residuals = sgt.PrefixSumResidual(data)
+
+    def segment(impl):
+        return impl(data, k, calc_error=residuals.sqr_residual)
+
+    t_list = util.best_of(repeat, segment, sgt.bottom_up)
+    t_array = util.best_of(repeat, segment, sgt.bottom_up_array)
+    mem_list = util.peak_memory(segment, sgt.bottom_up)[1]
+    mem_array = util.peak_memory(segment, sgt.bottom_up_array)[1]
+    same = segment(sgt.bottom_up) == segment(sgt.bottom_up_array)
+
+    print '%-28s %8d %10.3f %10.3f %7.2fx %10d %10d %8s' % (
+        name, len(data), t_list, t_array,
+        t_list / t_array, mem_list, mem_array, same)
+
+def run(k, repeat, synthetic):
+    print '%-28s %8s %10s %10s %8s %10s %10s %8s' % ('series', 'points',
+        'list s', 'array s', 'speedup', 'list kB', 'array kB', 'same')
+
+    for name, data in series():
+        compare(name, data, k, repeat)
+
+    if synthetic > 0:
+        compare('random walk', random_walk(synthetic), k, 1)
+
+if __name__ == '__main__':
+    import argparse
+
+    aparser = argparse.ArgumentParser(description=
+                'Benchmark the bottom-up segmenter implementations')
+    aparser.add_argument('-k', dest='segmentLength', 
+        type=int,
+        default=10,
+        help='ALG. PARAM: Average length of segment')
+    aparser.add_argument('-n', dest='repeat', 
+        type=int,
+        default=3,
+        help='Number of timed runs, the best is reported')
+    aparser.add_argument('-s', dest='synthetic', 
+        type=int,
+        default=200000,
+        help='Length of the synthetic random walk, 0 to skip it')
+
+    args = aparser.parse_args()
+    run(args.segmentLength, args.repeat, args.synthetic)
@@ -0,0 +1,110 @@
+#!/bin/python2
+'''t-SNE binary I/O benchmark
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Times writing data.dat, reading result.dat and reordering the result
+for the external tSNE_* binaries, comparing the per element struct
+pack/unpack loops calc_tsne used to run against its bulk
+tofile/fromfile versions.
+
+Run from the repository root with
+    python -m benchmarks.tsne_io [-r ROWS] [-c COLS]
+'''
+
+import os
+import shutil
+import tempfile
+import numpy as np
+from struct import pack
+from tsne import calc_tsne
+from benchmarks import util
+
+def legacy_write(dataMatrix, workDir, NO_DIMS=2, PERPLEX=30, LANDMARKS=1):
+    n,d = dataMatrix.shape
+    f = open(os.path.join(workDir, 'data.dat'), 'wb')
+    f.write(pack('=iiid',n,d,NO_DIMS,PERPLEX))
+    f.write(pack('=d',LANDMARKS))
+    for inst in dataMatrix :
+        for el in inst :
+            f.write(pack('=d',el))
+    f.close()
+
+def legacy_read(workDir):
+    f=open(os.path.join(workDir, 'result.dat'),'rb')
+    n,ND=calc_tsne.readbin('ii',f)
+    Xmat=np.empty((n,ND))
+    for i in range(n):
+        for j in range(ND):
+            Xmat[i,j]=calc_tsne.readbin('d',f)[0]
+    LM=calc_tsne.readbin('%ii'%n,f)
+    costs=calc_tsne.readbin('%id'%n,f)
+    f.close()
+    return (Xmat,LM,costs)
+
+def legacy_reorder(Xmat, LM):
+    X=np.zeros(Xmat.shape)
+    for i,lm in enumerate(LM):
+        X[lm]=Xmat[i]
+    return X
+
+def write_result(workDir, Xmat, LM):
+    # result.dat as the binary writes it
+    n, ND = Xmat.shape
+    f = open(os.path.join(workDir, 'result.dat'), 'wb')
+    f.write(pack('=ii', n, ND))
+    Xmat.astype(np.float64).tofile(f)
+    np.asarray(LM, dtype=np.int32).tofile(f)
+    np.zeros(n).tofile(f)
+    f.close()
+
+def run(rows, cols):
+    rng = np.random.RandomState(0)
+    data = rng.randn(rows, cols)
+    LM = rng.permutation(rows)
+
+    workDir = tempfile.mkdtemp(prefix='tsne-bench-')
+    try:
+        write_result(workDir, data, LM)
+
+        legacy = [
+            util.timed(legacy_write, data, workDir)[0],
+            util.timed(legacy_read, workDir)[0],
+            util.timed(legacy_reorder, data, LM)[0]]
+        old_bytes = open(os.path.join(workDir, 'data.dat'), 'rb').read()
+
+        bulk = [
+            util.timed(calc_tsne.writeDat, data, '', 2, 30, 1, workDir)[0],
+            util.timed(calc_tsne.readResult, '', workDir)[0],
+            util.timed(calc_tsne.reOrder, data, LM)[0]]
+        new_bytes = open(os.path.join(workDir, 'data.dat'), 'rb').read()
+
+        Xmat, LMread, costs = calc_tsne.readResult('', workDir)
+        same = (old_bytes == new_bytes
+            and np.array_equal(Xmat, legacy_read(workDir)[0])
+            and np.array_equal(calc_tsne.reOrder(data, LM),
+                legacy_reorder(data, LM)))
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    print
+    print 'Matrix: %d x %d, identical output: %s' % (rows, cols, same)
+    print '%-12s %12s %12s %10s' % ('step', 'per elem s', 'bulk s', 'speedup')
+    for step, old, new in zip(['write', 'read', 'reorder'], legacy, bulk):
+        print '%-12s %12.4f %12.4f %9.1fx' % (step, old, new, old / max(new, 1e-9))
+
+if __name__ == '__main__':
+    import argparse
+
+    aparser = argparse.ArgumentParser(description=
+                'Benchmark the data.dat/result.dat I/O of calc_tsne')
+    aparser.add_argument('-r', dest='rows', 
+        type=int,
+        default=50000,
+        help='Number of rows of the matrix')
+    aparser.add_argument('-c', dest='cols', 
+        type=int,
+        default=30,
+        help='Number of columns of the matrix')
+
+    args = aparser.parse_args()
+    run(args.rows, args.cols)
@@ -0,0 +1,89 @@
+'''Benchmark helpers
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Timing and memory measurement shared by the benchmark scripts.
+'''
+
+import gc
+import glob
+import os
+import sys
+import time
+import resource
+import multiprocessing as mp
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'data')
+
+def data_files(pattern='yahoo-*.csv'):
+    return sorted(glob.glob(os.path.join(DATA_DIR, pattern)))
+
+def timed(func, *args, **kwargs):
+    '''
+    Runs func(*args, **kwargs) once and returns (seconds, result)
+    '''
+    gc.collect()
+    start = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - start, result
+
+def best_of(repeat, func, *args, **kwargs):
+    '''
+    Best wall time in seconds of repeat runs of func(*args, **kwargs)
+    '''
+    return min(timed(func, *args, **kwargs)[0] for i in xrange(repeat))
+
+def _measure_child(conn, func, args, kwargs):
+    try:
+        gc.collect()
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        func(*args, **kwargs)
+        elapsed = time.time() - start
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        conn.send((None, (elapsed, after - before)))
+    except Exception as e:
+        # hand the failure to the parent instead of leaving it waiting
+        conn.send((e, None))
+    finally:
+        conn.close()
+
+def peak_memory(func, *args, **kwargs):
+    '''
+    Runs func(*args, **kwargs) in a forked process so its allocations
+    don't pollute the caller, returns (seconds, peak memory growth in kB)
+    '''
+    parent, child = mp.Pipe(duplex=False)
+    proc = mp.Process(target=_measure_child,
+        args=(child, func, args, kwargs))
+    proc.start()
+    # the parent's copy of child has to go, otherwise recv never sees
+    # the end of the pipe when the child dies without sending
+    child.close()
+    try:
+        error, result = parent.recv()
+    except EOFError:
+        proc.join()
+        raise Exception(('Measured process exited with code ',
+            proc.exitcode, ' before reporting'))
+    finally:
+        parent.close()
+    proc.join()
+    if error is not None:
+        raise error
+    if proc.exitcode != 0:
+        raise Exception(('Measured process exited with code ', proc.exitcode))
+    return result
+
+def silenced(func, *args, **kwargs):
+    '''
+    Runs func(*args, **kwargs) with stdout discarded, for stages that
+    report progress with print
+    '''
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
@@ -1,27 +1,43 @@
 #!/bin/python2
 import sys
+import numpy as np
 import matplotlib.dates as mdates
-from matplotlib.pyplot import figure, show, subplots
+from matplotlib.pyplot import figure, show
 from featuregenerator import preprocess as pp
 from featuregenerator import segmenter as sgt
 
-def run(infile, k, max_error=float('inf')):
+def run(infile, k, max_error=float('inf'), column='Close'):
     # extract features and segmented data from CSV file
-    dates, data = pp.csv_import(infile)
-    segd1 = sgt.bottom_up(data,k,calc_error=sgt.sqr_residual)
-    segd2 = sgt.bottom_up(data,k,calc_error=sgt.relative_sqr_residual)
+    dates, data = pp.csv_import(infile, column)
+    segd1, segd2 = segment_both(data, k)
 
     # output some statistics
     print 'original data points: %d' % len(data)
     print 'square residual data points: %d' % len(segd1)
     print 'rel. square res data points: %d' % len(segd2)
 
+    fig = figure(figsize=(8,10))
+    draw(fig, dates, data, segd1, segd2)
+    show()
+
+def segment_both(data, k):
+    # segmentations with the absolute and the relative residual
+    segd1 = sgt.bottom_up(data,k,calc_error=sgt.sqr_residual)
+    segd2 = sgt.bottom_up(data,k,calc_error=sgt.relative_sqr_residual)
+    return segd1, segd2
+
+def draw(fig, dates, data, segd1, segd2):
+    '''
+    Plots the segmented time series versus the original on fig, which
+    may be a pyplot figure or a bare matplotlib.figure.Figure
+    '''
     # convert dates to matplotlib.dates
-    dates = map(mdates.strpdate2num('%Y-%m-%d'),dates)
+    dates = mdates.date2num(np.array(dates, dtype='M8[D]'))
 
     # plot segmented time series versus original
-    fig, (orig_ts, seg1_ts, seg2_ts) = subplots(3, sharex=True)
-    fig.set_size_inches(8,10)
+    orig_ts = fig.add_subplot(3, 1, 1)
+    seg1_ts = fig.add_subplot(3, 1, 2, sharex=orig_ts)
+    seg2_ts = fig.add_subplot(3, 1, 3, sharex=orig_ts)
 
     orig_ts.plot_date(dates,data,'b-')
     orig_ts.set_title('original data')
@@ -36,7 +52,6 @@ def run(infile, k, max_error=float('inf')):
 
     # auto space the dates x-ticks
     fig.autofmt_xdate()
-    show()
 
 
 if __name__ == '__main__':
@@ -57,10 +72,15 @@ if __name__ == '__main__':
         type=float,
         default=float('inf'),
         help='Maximum allowed square residual during SEGMENTATION process')
+    aparser.add_argument('-a', dest='column',
+        action='store_const',
+        const='Adj Close',
+        default='Close',
+        help='Use adjusted close prices instead of close prices')
 
     args = aparser.parse_args()
 
     try:
-        run(args.csvFile, args.segmentLength, args.maxerror)
+        run(args.csvFile, args.segmentLength, args.maxerror, args.column)
     finally:
         args.csvFile.close()
@@ -0,0 +1,197 @@
+#!/bin/python2
+'''Embedding explorer
+Author: JumboSliceKimboShrimp && Riceballicious
+
+An interactive plot of a t-SNE embedding that stays responsive with
+hundreds of thousands of windows, used by visualize.py -x instead of
+interactive_plot.
+
+While more than max_points windows are in view the embedding is drawn as
+a density image of the view, binned with histogram2d, and once zoomed in
+far enough only the points inside the view are drawn. The view is
+redrawn whenever the axis limits change, with the points in view found
+by binary search over the x coordinates.
+
+Clicks are resolved with a KD-tree over the embedding instead of
+matplotlib's pick test over every point, and the first and last index
+into data of every window are computed once up front, so selecting a
+window only slices arrays and updates existing lines.
+'''
+import numpy as np
+from scipy.spatial import cKDTree
+from matplotlib.pyplot import figure, show
+from matplotlib.colors import LogNorm
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+import matplotlib.gridspec as gridspec
+from featuregenerator.segments import indices_of, values_of
+
+class Explorer(object):
+
+    def __init__(self, result, segd, dates, data, seglength, windowlength,
+            features=None, max_points=20000, bins=256, tolerance=5,
+            candidates=16):
+        '''
+        result holds the embedding of the windows of segd, row i being
+        the window segd[i:i+windowlength]. Clicks farther than tolerance
+        pixels from every point select nothing
+        '''
+        self.xy = np.asarray(result, dtype=float)[:, :2]
+        self.windowlength = windowlength
+        self.features = features
+        self.max_points = max_points
+        self.bins = bins
+        self.tolerance = tolerance
+        self.candidates = min(candidates, len(self.xy))
+
+        # window i covers the segments i..i+l-1, which span
+        # data[starts[i]:ends[i]+1]
+        self.inds = indices_of(segd)
+        self.vals = values_of(segd)
+        n = len(self.xy)
+        self.starts = self.inds[:n]
+        self.ends = self.inds[windowlength-1:windowlength-1+n]
+        self.data = np.asarray(data, dtype=float)
+        self.dates = np.asarray(dates)
+
+        self.tree = cKDTree(self.xy)
+        self.order = np.argsort(self.xy[:, 0], kind='mergesort')
+        self.sorted_x = self.xy[self.order, 0]
+
+        self.fig = figure(figsize=(8,10))
+        gs = gridspec.GridSpec(2,1, height_ratios=[4,1])
+        self.scatterplot = self.fig.add_subplot(gs[0])
+        self.segmentplot = self.fig.add_subplot(gs[1])
+        self.scatterplot.set_title(
+            'segment length: {}, window length:{}'.format(seglength,windowlength))
+
+        # every artist is created once and only gets new data later
+        self.image = self.scatterplot.imshow(np.ones((1, 1)), origin='lower',
+            aspect='auto', interpolation='nearest', cmap='Blues', norm=LogNorm())
+        self.points, = self.scatterplot.plot([], [], 'o', markersize=3)
+        self.dot, = self.scatterplot.plot([], [], 'ro')
+        self.segline, = self.segmentplot.plot([], [], 'r-')
+        self.rawline, = self.segmentplot.plot([], [], 'k:')
+
+        self.segmentplot.xaxis.set_major_locator(MaxNLocator(4, integer=True))
+        self.segmentplot.xaxis.set_major_formatter(FuncFormatter(self.date_at))
+
+        lo = self.xy.min(axis=0)
+        hi = self.xy.max(axis=0)
+        margin = 0.05 * np.maximum(hi - lo, 1e-9)
+        self.scatterplot.set_autoscale_on(False)
+        self.scatterplot.set_xlim(lo[0] - margin[0], hi[0] + margin[0])
+        self.scatterplot.set_ylim(lo[1] - margin[1], hi[1] + margin[1])
+
+        self._view = None
+        self.refresh()
+        self.scatterplot.callbacks.connect('xlim_changed', self.refresh)
+        self.scatterplot.callbacks.connect('ylim_changed', self.refresh)
+        self.fig.canvas.mpl_connect('button_press_event', self.onclick)
+
+    def date_at(self, x, pos=None):
+        i = int(round(x))
+        if 0 <= i < len(self.dates):
+            return str(self.dates[i])
+        return ''
+
+    def visible(self, xlim, ylim):
+        '''
+        Rows of the windows inside the view
+        '''
+        lo, hi = np.searchsorted(self.sorted_x, sorted(xlim))
+        rows = self.order[lo:hi]
+        y = self.xy[rows, 1]
+        ylo, yhi = sorted(ylim)
+        return rows[(y >= ylo) & (y <= yhi)]
+
+    def refresh(self, ax=None):
+        '''
+        Redraws the embedding for the current view, as points or as a
+        density image depending on how many windows are in it
+        '''
+        xlim = tuple(self.scatterplot.get_xlim())
+        ylim = tuple(self.scatterplot.get_ylim())
+        # both limits change on every zoom, draw once
+        if (xlim, ylim) == self._view:
+            return
+        self._view = (xlim, ylim)
+
+        rows = self.visible(xlim, ylim)
+        if len(rows) <= self.max_points:
+            self.points.set_data(self.xy[rows, 0], self.xy[rows, 1])
+            self.points.set_visible(True)
+            self.image.set_visible(False)
+        else:
+            counts, xedges, yedges = np.histogram2d(self.xy[rows, 0],
+                self.xy[rows, 1], bins=self.bins,
+                range=[sorted(xlim), sorted(ylim)])
+            self.image.set_data(np.ma.masked_equal(counts.T, 0))
+            self.image.set_extent(xlim + ylim)
+            self.image.set_clim(1, max(counts.max(), 2))
+            self.image.set_visible(True)
+            self.points.set_visible(False)
+
+        self.fig.canvas.draw_idle()
+
+    def nearest(self, x, y):
+        '''
+        Row of the window drawn closest to the pixel (x, y), None when
+        none is within tolerance pixels of it
+        '''
+        point = self.scatterplot.transData.inverted().transform((x, y))
+        # nearest in the embedding are not always nearest on screen
+        # when the axes are scaled differently, so check a few
+        dist, rows = self.tree.query(point, self.candidates)
+        rows = np.atleast_1d(rows)
+        pixels = self.scatterplot.transData.transform(self.xy[rows])
+        dist = np.hypot(pixels[:, 0] - x, pixels[:, 1] - y)
+        best = np.argmin(dist)
+        if dist[best] > self.tolerance:
+            return None
+        return rows[best]
+
+    def onclick(self, event):
+        if event.inaxes is not self.scatterplot or event.button != 1:
+            return
+        # leave clicks to the zoom and pan tools while they are active
+        toolbar = getattr(self.fig.canvas, 'toolbar', None)
+        if toolbar is not None and toolbar.mode:
+            return
+
+        ind = self.nearest(event.x, event.y)
+        if ind is not None:
+            self.select(ind)
+
+    def select(self, ind):
+        '''
+        Highlights window ind and plots it under the embedding
+        '''
+        if self.features is not None:
+            print(self.features[ind])
+        l = self.windowlength
+
+        self.dot.set_data(self.xy[ind:ind+1, 0], self.xy[ind:ind+1, 1])
+
+        # the segment and the original un-segmented series under it
+        start = self.starts[ind]
+        end = self.ends[ind] + 1
+        raw = self.data[start:end]
+        self.segline.set_data(self.inds[ind:ind+l], self.vals[ind:ind+l])
+        self.rawline.set_data(np.arange(start, end), raw)
+
+        self.segmentplot.set_xlim(start, end - 1)
+        lo = raw.min()
+        hi = raw.max()
+        margin = 0.05 * max(hi - lo, 1e-9)
+        self.segmentplot.set_ylim(lo - margin, hi + margin)
+
+        self.fig.canvas.draw_idle()
+
+def explore(result, segd, dates, data, seglength, windowlength, features):
+    '''
+    Same arguments as visualize.interactive_plot
+    '''
+    explorer = Explorer(result, segd, dates, data, seglength, windowlength,
+        features)
+    show()
+    return explorer
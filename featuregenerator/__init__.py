@@ -1 +1,2 @@
-__all__ = ['segmenter', 'featextract', 'preprocess']
+__all__ = ['segmenter', 'featextract', 'preprocess', 'indexheap', 'featstore', 'stagecache', 'ingest',
+    'patternindex', 'instrument', 'segments', 'featmatrix']
@@ -16,6 +16,10 @@ E.g. input: list of segments [p0,p1,p2,...,pN]
 '''
 
 import numpy as np
+from scipy import fftpack
+from collections import deque
+import instrument
+from segments import values_of
 
 def compute_simple_trend_features(window):
     '''Given a window of N points as a list, 
@@ -52,23 +56,204 @@ def compute_jimmy_and_ricky_acf_features(window):
 
     return first + acf
 
+def compute_jimmy_and_ricky_fft_acf_features(window):
+    '''compute_jimmy_and_ricky_acf_features with every lag taken from
+    one FFT of the window, for long windows
+    '''
+    feats = compute_jimmy_and_ricky_fft_acf_features_windows(
+        np.asarray(window, dtype=float)[None, :])
+    return feats[0].tolist()
+
+def sliding_windows(vals, l):
+    '''Given a sequence of N values, returns a read-only (N-l+1, l) 
+    strided view whose row i is vals[i:i+l], without copying
+    '''
+    vals = np.ascontiguousarray(vals, dtype=float)
+    n = vals.shape[0]
+    stride = vals.strides[0]
+    windows = np.lib.stride_tricks.as_strided(vals, 
+        shape=(n-l+1, l), strides=(stride, stride))
+    windows.flags.writeable = False
+    return windows
+
+def _checked_divide(num, den):
+    # the per window features divide python floats, which raises
+    # instead of producing inf/nan, so keep that behaviour
+    if (den == 0).any():
+        raise ZeroDivisionError('float division by zero')
+    return num / den
+
+def compute_simple_trend_features_windows(windows):
+    '''compute_simple_trend_features for every row of a 2-D array
+    of windows at once
+    '''
+    diffs = windows[:, 1:] - windows[:, :-1]
+    feats = np.empty(windows.shape)
+    feats[:, 0] = np.sign(diffs[:, 0])
+    feats[:, 1:-1] = _checked_divide(diffs[:, 1:], diffs[:, :-1])
+    feats[:, -1] = _checked_divide(windows[:, -1] - windows[:, 1], 
+        abs(diffs[:, 1]))
+
+    return feats
+
+def compute_jimmy_and_ricky_simple_trend_features_windows(windows):
+    '''compute_jimmy_and_ricky_simple_trend_features for every row 
+    of a 2-D array of windows at once
+    '''
+    feats = np.empty(windows.shape)
+    feats[:, 0] = windows[:, -1] - windows[:, 0]
+    feats[:, 1:-1] = _checked_divide(windows[:, 2:] - windows[:, :-2], 
+        windows[:, 1:-1] - windows[:, :-2])
+    feats[:, -1] = _checked_divide(windows[:, -1] - windows[:, 1], 
+        abs(windows[:, 2] - windows[:, 1]))
+
+    return feats
+
+def compute_jimmy_and_ricky_acf_features_windows(windows):
+    '''compute_jimmy_and_ricky_acf_features for every row of a 2-D
+    array of windows at once, one set of array operations per lag
+    '''
+    m, l = windows.shape
+    feats = np.empty((m, max(l-2, 1)))
+    feats[:, 0] = windows[:, -1] - windows[:, 0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in xrange(1, l-2):
+            feats[:, i] = _lagged_corrcoef(windows[:, :-i], windows[:, i:])
+
+    return feats
+
+def _lagged_corrcoef(x, y):
+    # row-wise np.corrcoef(x, y)[1,0], following its order of operations
+    fact = x.shape[1] - 1.0
+    x = x - x.mean(axis=1)[:, None]
+    y = y - y.mean(axis=1)[:, None]
+    cxy = np.einsum('ij,ij->i', x, y) / fact
+    cxx = np.einsum('ij,ij->i', x, x) / fact
+    cyy = np.einsum('ij,ij->i', y, y) / fact
+
+    return np.clip(cxy / np.sqrt(cyy) / np.sqrt(cxx), -1, 1)
+
+def compute_jimmy_and_ricky_fft_acf_features_windows(windows, block=1 << 22):
+    '''compute_jimmy_and_ricky_acf_features for every row of a 2-D
+    array of windows at once, with all lags in one pass instead of one
+    per lag, so the cost is O(l log l) per window rather than O(l^2).
+
+    The lagged Pearson correlation of x = w[:-i] and y = w[i:] is built
+    from the sums of x, y, x^2 and y^2, read off cumulative sums, and
+    the sums of x*y for every lag, the autocorrelation of the window
+    computed with a real FFT. Windows are centered on their mean first,
+    which leaves the correlations unchanged but keeps the sums small.
+
+    Agrees with the per lag np.corrcoef to floating point tolerance
+    (within 1e-9 on the bundled data for l up to 100) and, like it,
+    gives nan for lags where either slice is constant. Rows are
+    processed about block FFT points at a time to bound memory.
+    '''
+    m, l = windows.shape
+    feats = np.empty((m, max(l-2, 1)))
+    feats[:, 0] = windows[:, -1] - windows[:, 0]
+    if l <= 3:
+        return feats
+
+    lags = np.arange(1, l-2)
+    n = (l - lags).astype(float)
+    # FFT length with no wrap around of lags up to l-1
+    nfft = 1 << int(2*l - 1).bit_length()
+    rows = max(1, block // nfft)
+
+    for first in xrange(0, m, rows):
+        w = windows[first:first+rows]
+        z = w - w.mean(axis=1)[:, None]
+        zero = np.zeros((len(z), 1))
+        s = np.hstack([zero, np.cumsum(z, axis=1)])
+        ss = np.hstack([zero, np.cumsum(z*z, axis=1)])
+        sxy = _autocorrelation(z, nfft)[:, lags]
+
+        sx = s[:, l - lags]
+        sy = s[:, l:l+1] - s[:, lags]
+        sxx = ss[:, l - lags]
+        syy = ss[:, l:l+1] - ss[:, lags]
+
+        cxy = sxy - sx*sy/n
+        cxx = sxx - sx*sx/n
+        cyy = syy - sy*sy/n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = np.clip(cxy / np.sqrt(cyy) / np.sqrt(cxx), -1, 1)
+
+        # a slice is constant when none of its steps change the value,
+        # which the sums above only get to rounding error
+        moves = np.hstack([zero, np.cumsum(np.diff(w, axis=1) != 0, axis=1)])
+        flat = ((moves[:, l - lags - 1] == 0)
+            | (moves[:, l-1:l] - moves[:, lags] == 0))
+        corr[flat] = np.nan
+        feats[first:first+rows, 1:] = corr
+
+    return feats
+
+def _autocorrelation(z, nfft):
+    # sums of z[:, t]*z[:, t+i] for every lag i < nfft/2, through the
+    # power spectrum. scipy's packed real FFT is several times faster
+    # than np.fft here: [y0, re1, im1, re2, im2, ..., y(nfft/2)]
+    padded = np.zeros((len(z), nfft))
+    padded[:, :z.shape[1]] = z
+    power = fftpack.rfft(padded, axis=1, overwrite_x=True)
+    power *= power
+    power[:, 1:-1:2] += power[:, 2:-1:2]
+    power[:, 2:-1:2] = 0
+    return fftpack.irfft(power, axis=1, overwrite_x=True)
+
+# per window feature routines and their equivalents over all windows
+WINDOWED_FEATURES = {
+    compute_simple_trend_features: 
+        compute_simple_trend_features_windows,
+    compute_jimmy_and_ricky_simple_trend_features: 
+        compute_jimmy_and_ricky_simple_trend_features_windows,
+    compute_jimmy_and_ricky_acf_features: 
+        compute_jimmy_and_ricky_acf_features_windows,
+    compute_jimmy_and_ricky_fft_acf_features:
+        compute_jimmy_and_ricky_fft_acf_features_windows,
+}
+
+@instrument.timed()
 def extract_features(data, l, 
                     compute_feature=compute_jimmy_and_ricky_acf_features):
-    '''Given data as a list of (index,value) pairs,
+    '''Given data as a Segments or a list of (index,value) pairs,
     and 1<l<len(data),
     extracts features for sliding windows of width length l
     using the routine compute_feature
+
+    The routines in WINDOWED_FEATURES are run over a strided view of all
+    windows at once instead of once per window. For long windows pass
+    compute_jimmy_and_ricky_fft_acf_features, which gives the same
+    features as compute_jimmy_and_ricky_acf_features with all lags
+    computed in one batch
     '''
     if l >= len(data) or l < 1:
         raise Exception(
             ('Invalid window length=',l, ' with segmented data length=',len(data)))
 
-    garbage, vals = zip(*data)
+    vals = values_of(data)
 
-    features = [compute_feature(vals[i:i+l]) 
-        for i in xrange(len(vals)-l+1)]
+    return standardize(compute_windows(vals, l, compute_feature))
 
-    return standardize(features)
+@instrument.timed()
+def compute_windows(vals, l, compute_feature):
+    '''Unstandardized features of every length l window of vals
+    '''
+    windows = max(len(vals)-l+1, 0)
+    instrument.count('windows extracted', windows)
+    if compute_feature in (compute_jimmy_and_ricky_acf_features,
+            compute_jimmy_and_ricky_fft_acf_features):
+        instrument.count('lagged correlations', windows * max(l-3, 0))
+
+    if compute_feature in WINDOWED_FEATURES:
+        return WINDOWED_FEATURES[compute_feature](sliding_windows(vals, l))
+
+    # per window routines get python floats, as they always have
+    vals = np.asarray(vals).tolist()
+    return [compute_feature(vals[i:i+l]) 
+        for i in xrange(len(vals)-l+1)]
 
 def standardize(features):
     # standardizes every feature to standard normal
@@ -78,36 +263,79 @@ def standardize(features):
 
     return (features - mean) / std
 
+@instrument.timed()
 def classify(segd, l):
-    inds, vals = zip(*segd)
-    segs = [vals[i:i+l] for i in xrange(len(vals)-l+1)]
+    '''Labels every length l window of segd, a Segments or a list of
+    (index,value) pairs, as 1 (reversal INC-DEC), 2 (reversal DEC-INC),
+    3 (continuation INC), 4 (continuation DEC) or 0 (neither),
+    returned as an integer array with one label per window
+    '''
+    vals = values_of(segd)
+    if len(vals) < l:
+        return np.zeros(0, dtype=int)
+    return classify_windows(sliding_windows(vals, l))
+
+def classify_windows(windows):
+    '''Labels of classify for every row of a 2-D array of windows,
+    using the max and min of all rows at once
+    '''
+    first = windows[:, 0]
+    last = windows[:, -1]
+    inc = last - first
+    top = windows.max(axis=1)
+    bot = windows.min(axis=1)
+    revTOP = (top > last) & (top > first)
+    revBOT = (bot < last) & (bot < first)
 
-    classes = [0] * len(segs)
+    # first matching condition wins, as in the if/elif chain
+    # this replaced, wavey windows with both reversals are 0
+    return np.select(
+        [revTOP & revBOT, revTOP, revBOT, inc > 0, inc < 0],
+        [0, 1, 2, 3, 4], 0)
 
-    for i in xrange(len(segs)):
-        s = segs[i]
+def stream_classify(vals, l):
+    '''Generator of the labels of classify for values arriving one at a
+    time from the iterable vals, yielding the label of every window as
+    soon as its last value arrives.
 
-        inc = s[-1] - s[0]
-        top = max(s)
-        bot = min(s)
-        revTOP = top > s[-1] and top > s[0]
-        revBOT = bot < s[-1] and bot < s[0]
-        if revTOP and revBOT:
-            # wavey pattern?
+    The window max and min are kept in monotonic deques of
+    (position, value), so each label costs amortized O(1)
+    '''
+    maxq = deque()
+    minq = deque()
+    window = deque(maxlen=l)
+
+    for i, v in enumerate(vals):
+        window.append(v)
+        while maxq and maxq[-1][1] <= v:
+            maxq.pop()
+        maxq.append((i, v))
+        while minq and minq[-1][1] >= v:
+            minq.pop()
+        minq.append((i, v))
+
+        # drop values that slid out of the window
+        if maxq[0][0] <= i - l:
+            maxq.popleft()
+        if minq[0][0] <= i - l:
+            minq.popleft()
+        if i < l - 1:
             continue
+
+        first = window[0]
+        top = maxq[0][1]
+        bot = minq[0][1]
+        revTOP = top > v and top > first
+        revBOT = bot < v and bot < first
+        if revTOP and revBOT:
+            yield 0
         elif revTOP:
-            # reversal pattern INC-DEC
-            classes[i] = 1
-            continue
+            yield 1
         elif revBOT:
-            # reversal pattern DEC-INC
-            classes[i] = 2
-            continue
-        elif inc > 0:
-            # continuation pattern INC
-            classes[i] = 3
-        elif inc < 0:
-            # continuation pattern DEC
-            classes[i] = 4
-
-    return classes
\ No newline at end of file
+            yield 2
+        elif v - first > 0:
+            yield 3
+        elif v - first < 0:
+            yield 4
+        else:
+            yield 0
@@ -0,0 +1,218 @@
+'''Out-of-core feature matrix
+Author: JumboSliceKimboShrimp && Riceballicious
+
+The features of the sliding windows of many segmented series, kept in a
+memory-mapped .npy file instead of in RAM, for universes of symbols
+whose feature matrix would not fit.
+
+build() streams the windows of every series into the file chunk_rows
+windows at a time, with np.lib.format.open_memmap, and accumulates the
+mean and variance of every feature per series on the way (pairwise
+updates, as in FeatureStore). The file holds the raw features; rows are
+standardized with the statistics of their series only when read, so
+they come out as extract_features would give them for that series.
+
+Reading is chunked as well:
+    - matrix[a:b] and matrix[rows] return standardized rows, so the
+      matrix can be passed to calc_tsne.PCA (and bhtsne.calc_tsne) with
+      the 'incremental' method, which only slices BATCH_ROWS at a time
+    - chunks() yields standardized blocks of rows in order
+    - nearest() is an exact nearest neighbour scan over the chunks
+    - labels holds the classify label of every window, computed chunk
+      by chunk with the features
+
+A matrix is a directory of .npy files and a meta.json, like a saved
+PatternIndex, and opens memory-mapped with load().
+'''
+
+import os
+import json
+import numpy as np
+from numpy.lib.format import open_memmap
+import featextract as fex
+from segments import indices_of, values_of
+
+class FeatureMatrix(object):
+
+    def __init__(self, path, raw, labels, start, offsets, mean, std, names,
+            l, compute_feature):
+        self.path = path
+        self.raw = raw
+        self.labels = labels
+        self.start = start
+        # rows of series i are offsets[i]:offsets[i+1]
+        self.offsets = offsets
+        self.mean = mean
+        self.std = std
+        self.names = names
+        self.l = l
+        self.compute_feature = compute_feature
+
+    @classmethod
+    def build(cls, path, series, l, names=None,
+            compute_feature=fex.compute_jimmy_and_ricky_acf_features,
+            chunk_rows=65536):
+        '''
+        Writes the features of the length l windows of every segd in
+        series, Segments or lists of (index, value) pairs, to the
+        directory at path and returns the matrix, open for reading
+        '''
+        if names is None:
+            names = [str(i) for i in xrange(len(series))]
+        counts = [len(segd) - l + 1 for segd in series]
+        for segd, count in zip(series, counts):
+            if l < 1 or count < 2:
+                raise Exception(
+                    ('Invalid window length=',l, ' with segmented data length=',len(segd)))
+
+        # the first window gives the number of features
+        width = np.asarray(fex.compute_windows(values_of(series[0])[:l], l,
+            compute_feature)).shape[1]
+        offsets = np.r_[0, np.cumsum(counts)].astype(np.int64)
+        total = int(offsets[-1])
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        raw = open_memmap(os.path.join(path, 'features.npy'), mode='w+',
+            dtype=float, shape=(total, width))
+        labels = open_memmap(os.path.join(path, 'labels.npy'), mode='w+',
+            dtype=np.int8, shape=(total,))
+        start = open_memmap(os.path.join(path, 'start.npy'), mode='w+',
+            dtype=np.int64, shape=(total,))
+        mean = np.zeros((len(series), width))
+        std = np.zeros((len(series), width))
+
+        for s, segd in enumerate(series):
+            vals = values_of(segd)
+            first = offsets[s]
+            start[first:offsets[s+1]] = indices_of(segd)[:counts[s]]
+
+            n = 0
+            smean = m2 = 0
+            for a in xrange(0, counts[s], chunk_rows):
+                b = min(a + chunk_rows, counts[s])
+                # windows a..b-1 take values a..b+l-2
+                window_vals = vals[a:b + l - 1]
+                rows = np.asarray(fex.compute_windows(window_vals, l,
+                    compute_feature), dtype=float)
+                raw[first + a:first + b] = rows
+                labels[first + a:first + b] = fex.classify_windows(
+                    fex.sliding_windows(window_vals, l))
+                n, smean, m2 = _combine(n, smean, m2, rows)
+
+            mean[s] = smean
+            std[s] = np.sqrt(m2 / n)
+
+        raw.flush()
+        labels.flush()
+        start.flush()
+        del raw, labels, start
+        np.save(os.path.join(path, 'offsets.npy'), offsets)
+        np.save(os.path.join(path, 'mean.npy'), mean)
+        np.save(os.path.join(path, 'std.npy'), std)
+        meta = {'l': l, 'compute_feature': compute_feature.__name__,
+            'names': list(names)}
+        with open(os.path.join(path, 'meta.json'), 'w') as out:
+            json.dump(meta, out)
+
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Opens the matrix written by build at path, memory-mapped
+        '''
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        return cls(path,
+            np.load(os.path.join(path, 'features.npy'), mmap_mode='r'),
+            np.load(os.path.join(path, 'labels.npy'), mmap_mode='r'),
+            np.load(os.path.join(path, 'start.npy'), mmap_mode='r'),
+            np.load(os.path.join(path, 'offsets.npy')),
+            np.load(os.path.join(path, 'mean.npy')),
+            np.load(os.path.join(path, 'std.npy')),
+            [str(n) for n in meta['names']],
+            meta['l'], getattr(fex, meta['compute_feature']))
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, rows):
+        '''
+        Standardized rows, for a slice or an array of row numbers
+        '''
+        if isinstance(rows, slice):
+            a, b, step = rows.indices(len(self))
+            if step == 1:
+                return self._standardized(a, b)
+            rows = np.arange(a, b, step)
+        rows = np.asarray(rows, dtype=np.int64)
+        return self._scale(self.raw[rows], self.series_of(rows))
+
+    def series_of(self, rows):
+        '''
+        Index into names of the series of every row
+        '''
+        return np.searchsorted(self.offsets, rows, 'right') - 1
+
+    def series(self, i):
+        '''
+        Standardized rows of series i
+        '''
+        return self._standardized(self.offsets[i], self.offsets[i+1])
+
+    def chunks(self, chunk_rows=65536):
+        '''
+        Yields (first row, standardized rows) for blocks of chunk_rows
+        rows in order
+        '''
+        for a in xrange(0, len(self), chunk_rows):
+            yield a, self._standardized(a, min(a + chunk_rows, len(self)))
+
+    def nearest(self, vector, top=10, chunk_rows=65536):
+        '''
+        Distances and row numbers of the top rows closest to the
+        standardized feature vector, closest first, from one pass over
+        the chunks
+        '''
+        vector = np.asarray(vector, dtype=float)
+        dist = np.empty(0)
+        found = np.empty(0, dtype=np.int64)
+        for a, block in self.chunks(chunk_rows):
+            d = np.sqrt(((block - vector)**2).sum(axis=1))
+            # keep only the best top seen so far
+            dist = np.r_[dist, d]
+            found = np.r_[found, np.arange(a, a + len(block))]
+            order = np.argsort(dist, kind='mergesort')[:top]
+            dist = dist[order]
+            found = found[order]
+        return dist, found
+
+    def _standardized(self, a, b):
+        if a >= b:
+            return np.empty((0, self.shape[1]))
+        first = self.series_of(a)
+        last = self.series_of(b - 1)
+        if first == last:
+            return (self.raw[a:b] - self.mean[first]) / self.std[first]
+        return self._scale(self.raw[a:b], self.series_of(np.arange(a, b)))
+
+    def _scale(self, raw, series):
+        return (raw - self.mean[series]) / self.std[series]
+
+def _combine(n, mean, m2, rows):
+    # count, mean and sum of squared deviations of the rows seen so
+    # far combined with those of rows
+    m = len(rows)
+    rmean = rows.mean(axis=0)
+    rm2 = ((rows - rmean)**2).sum(axis=0)
+    if n == 0:
+        return m, rmean, rm2
+    total = n + m
+    delta = rmean - mean
+    return (total, mean + delta * m / total,
+        m2 + rm2 + delta**2 * n * m / total)
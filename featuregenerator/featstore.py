@@ -0,0 +1,124 @@
+'''Incremental feature store
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Keeps the features of a segmented time series between runs so that when
+the series is re-segmented (e.g. once a day) only the windows touching
+changed segments are extracted again.
+
+Standardization statistics are kept as running means and sums of squared
+deviations (Welford/Chan style), so windows can be added and retracted
+without another pass over the whole feature matrix.
+'''
+
+import numpy as np
+import featextract as fex
+from segments import values_of
+
+class FeatureStore(object):
+
+    def __init__(self, l, 
+            compute_feature=fex.compute_jimmy_and_ricky_acf_features):
+        self.l = l
+        self.compute_feature = compute_feature
+
+        self.segd = []
+        # raw features, rows [0, count) are in use and the
+        # array grows by doubling
+        self._rows = None
+        self.count = 0
+
+        # running statistics of the rows in use
+        self.mean = None
+        self.m2 = None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def features(self):
+        '''
+        Unstandardized features, one row per window
+        '''
+        return self._rows[:self.count]
+
+    def update(self, segd):
+        '''
+        Replaces the stored segmentation with segd, a Segments or a
+        list of (index, value) pairs, re-extracting only windows that start
+        within l segments of the first changed segment.
+
+        Returns the number of windows extracted.
+        '''
+        l = self.l
+        if l >= len(segd) or l < 1:
+            raise Exception(
+                ('Invalid window length=',l, ' with segmented data length=',len(segd)))
+
+        # length of the unchanged prefix
+        common = 0
+        for old, new in zip(self.segd, segd):
+            if old != new:
+                break
+            common += 1
+
+        # window i covers segments i..i+l-1
+        keep = min(max(common - l + 1, 0), self.count)
+        if keep < self.count:
+            self._retract(self.features[keep:])
+            self.count = keep
+
+        vals = values_of(segd[keep:])
+        new_rows = np.asarray(
+            fex.compute_windows(vals, l, self.compute_feature), dtype=float)
+        self._append(new_rows)
+        self.segd = list(segd)
+
+        return len(new_rows)
+
+    def standardized(self):
+        '''
+        Features standardized with the running mean and std, the same
+        as fex.standardize on the raw features
+        '''
+        std = np.sqrt(self.m2 / self.count)
+        return (self.features - self.mean) / std
+
+    def _append(self, rows):
+        n = len(rows)
+        if n == 0:
+            return
+
+        if self._rows is None:
+            self._rows = np.empty((2*n, rows.shape[1]))
+        elif self.count + n > len(self._rows):
+            grown = np.empty((2*(self.count + n), self._rows.shape[1]))
+            grown[:self.count] = self.features
+            self._rows = grown
+        self._rows[self.count:self.count + n] = rows
+
+        # combine the running statistics with those of the new rows
+        mean = rows.mean(axis=0)
+        m2 = ((rows - mean)**2).sum(axis=0)
+        if self.count == 0:
+            self.mean, self.m2 = mean, m2
+        else:
+            total = self.count + n
+            delta = mean - self.mean
+            self.mean = self.mean + delta * n / total
+            self.m2 = self.m2 + m2 + delta**2 * self.count * n / total
+        self.count += n
+
+    def _retract(self, rows):
+        n = len(rows)
+        rest = self.count - n
+        if rest == 0:
+            self.mean = self.m2 = None
+            return
+
+        # undo the combination of the statistics with those of rows
+        mean = rows.mean(axis=0)
+        m2 = ((rows - mean)**2).sum(axis=0)
+        rest_mean = (self.count * self.mean - n * mean) / rest
+        delta = mean - rest_mean
+        self.m2 = self.m2 - m2 - delta**2 * rest * n / self.count
+        self.mean = rest_mean
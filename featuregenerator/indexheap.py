@@ -0,0 +1,132 @@
+'''Indexed binary min heap
+Author: JumboSliceKimboShrimp && Riceballicious
+
+A binary min heap over the integer ids 0..n-1 backed by NumPy arrays.
+Unlike heapq every id knows its position in the heap, so the key of any
+id can be changed (or the id removed) in O(log n) without the
+delete-and-reinsert dance heapdict does through a python dict.
+
+Ties between equal keys are broken by the smaller id, which for the
+segmenters means the left-most pair is merged first.
+'''
+
+import numpy as np
+
+class IndexedHeap(object):
+
+    def __init__(self, keys):
+        '''
+        Builds the heap over ids 0..len(keys)-1 where id i starts out
+        with key keys[i]
+        '''
+        n = len(keys)
+        self.key = np.array(keys, dtype=float)
+        # heap[j] is the id stored at heap position j,
+        # pos[i] is the heap position of id i or -1 once removed.
+        # ids sorted by (key, id) already satisfy the heap property,
+        # which is much cheaper than sifting n/2 nodes in python
+        self.heap = np.lexsort((np.arange(n), self.key)).astype(np.int64)
+        self.pos = np.empty(n, dtype=np.int64)
+        self.pos[self.heap] = np.arange(n)
+        self.size = n
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, i):
+        return self.pos[i] >= 0
+
+    def _sift_up(self, j):
+        # moves the id at position j up, shifting parents down into the
+        # hole instead of swapping at every level
+        heap = self.heap
+        pos = self.pos
+        key = self.key
+        i = heap[j]
+        ki = key[i]
+        while j > 0:
+            parent = (j - 1) >> 1
+            ip = heap[parent]
+            kp = key[ip]
+            if kp < ki or (kp == ki and ip < i):
+                break
+            heap[j] = ip
+            pos[ip] = j
+            j = parent
+        heap[j] = i
+        pos[i] = j
+
+    def _sift_down(self, j):
+        heap = self.heap
+        pos = self.pos
+        key = self.key
+        size = self.size
+        i = heap[j]
+        ki = key[i]
+        while True:
+            child = 2*j + 1
+            if child >= size:
+                break
+            ic = heap[child]
+            kc = key[ic]
+            if child + 1 < size:
+                ir = heap[child + 1]
+                kr = key[ir]
+                if kr < kc or (kr == kc and ir < ic):
+                    child += 1
+                    ic = ir
+                    kc = kr
+            if ki < kc or (ki == kc and i < ic):
+                break
+            heap[j] = ic
+            pos[ic] = j
+            j = child
+        heap[j] = i
+        pos[i] = j
+
+    def peek(self):
+        '''
+        Returns (id, key) of the minimum without removing it
+        '''
+        i = self.heap[0]
+        return i, self.key[i]
+
+    def pop(self):
+        '''
+        Removes and returns (id, key) of the minimum
+        '''
+        i = self.heap[0]
+        self.remove(i)
+        return i, self.key[i]
+
+    def remove(self, i):
+        '''
+        Removes id i from the heap
+        '''
+        heap = self.heap
+        pos = self.pos
+        j = pos[i]
+        last = self.size - 1
+        self.size = last
+        pos[i] = -1
+
+        if j != last:
+            # move the last id into the hole, it may need to go either way
+            moved = heap[last]
+            heap[j] = moved
+            pos[moved] = j
+            self._sift_down(j)
+            if pos[moved] == j:
+                self._sift_up(j)
+
+    def update(self, i, key):
+        '''
+        Sets the key of id i, moving it up (decrease-key) or
+        down (increase-key) as needed
+        '''
+        old = self.key[i]
+        self.key[i] = key
+        if key < old:
+            self._sift_up(self.pos[i])
+        else:
+            self._sift_down(self.pos[i])
@@ -0,0 +1,90 @@
+'''Columnar time series ingestion
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Reads Yahoo Finance .csv files
+    Date,Open,High,Low,Close,Volume,Adj Close
+straight into typed NumPy arrays instead of a python tuple per row, and
+keeps a binary copy of the parsed table next to the csv that later loads
+memory-map instead of parsing again.
+
+The binary copy is a .npy file holding a structured array with a
+datetime64[D] 'date' field and a float64 field per price column, named
+after the csv header in lower case with spaces as underscores
+(e.g. 'adj_close'). Rows are in chronological order.
+'''
+
+import os
+import tempfile
+import numpy as np
+
+def field_name(column):
+    return column.strip().lower().replace(' ', '_')
+
+def read_columns(csvfile):
+    '''
+    Splits a csv file (path or open file) into its header and a
+    (rows, columns) array of strings, as laid out in the file
+    '''
+    if isinstance(csvfile, basestring):
+        with open(csvfile, 'rb') as f:
+            text = f.read()
+    else:
+        text = csvfile.read()
+
+    lines = text.splitlines()
+    header = lines[0].split(',')
+    body = [line for line in lines[1:] if line]
+
+    # one split over the whole body instead of one per row
+    cells = np.array(','.join(body).split(','))
+    return header, cells.reshape((len(body), len(header)))
+
+def to_table(header, cells):
+    '''
+    Converts string cells to a structured array in chronological
+    order, assuming the Yahoo layout of reverse chronological rows
+    '''
+    dtype = [('date', 'M8[D]')] + [(field_name(c), 'f8') for c in header[1:]]
+    table = np.empty(len(cells), dtype=dtype)
+    table['date'] = cells[::-1, 0].astype('M8[D]')
+    for i, column in enumerate(header[1:]):
+        table[field_name(column)] = cells[::-1, i + 1].astype(float)
+    return table
+
+def cache_path(csvpath):
+    return os.path.splitext(csvpath)[0] + '.series.npy'
+
+def load_table(csvpath, use_cache=True):
+    '''
+    Structured array of every column of the csv at csvpath. With
+    use_cache, the binary copy is memory-mapped when it is newer than
+    the csv and written after parsing otherwise
+    '''
+    cached = cache_path(csvpath)
+    if (use_cache and os.path.exists(cached)
+            and os.path.getmtime(cached) >= os.path.getmtime(csvpath)):
+        return np.load(cached, mmap_mode='r')
+
+    table = to_table(*read_columns(csvpath))
+    if use_cache:
+        # write aside and rename so concurrent loads of the same csv
+        # never map half a file
+        fd, tmp = tempfile.mkstemp(suffix='.npy',
+            dir=os.path.dirname(os.path.abspath(cached)))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                np.save(out, table)
+            os.rename(tmp, cached)
+        except:
+            os.remove(tmp)
+            raise
+    return table
+
+def load_series(csvpath, column='Close', use_cache=True):
+    '''
+    Returns (dates, prices) as datetime64[D] and float64 arrays in
+    chronological order, prices taken from column, e.g. 'Close'
+    or 'Adj Close'
+    '''
+    table = load_table(csvpath, use_cache)
+    return table['date'], table[field_name(column)]
@@ -0,0 +1,151 @@
+'''Pipeline instrumentation
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Stage timers and counters for the preprocessing and t-SNE code, e.g.
+
+    instrument.enable()
+    visualize.run(...)
+    instrument.write('run.json')
+
+writes a Chrome trace (load it in chrome://tracing or Perfetto) with a
+span per timed stage call and the counters sampled at the end of every
+span. instrument.write(path, 'summary') writes the total seconds and calls per stage and the final
+value of every counter as plain JSON instead.
+
+Tracing is off by default. Timed functions then only pay one flag test
+per call, and hot loops are never instrumented directly: residual
+functions are wrapped with counting() only when tracing is on, and
+other counts are added once per stage call.
+'''
+
+import os
+import json
+import time
+import functools
+
+_enabled = False
+_origin = 0.0
+_events = []
+_counters = {}
+
+def enable():
+    '''
+    Starts a new trace, dropping anything recorded before
+    '''
+    global _enabled, _origin, _events, _counters
+    _enabled = True
+    _origin = time.time()
+    _events = []
+    _counters = {}
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def enabled():
+    return _enabled
+
+def _now():
+    # microseconds since enable, the unit of Chrome traces
+    return (time.time() - _origin) * 1e6
+
+def count(name, n=1):
+    '''
+    Adds n to the counter name
+    '''
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+class _Span(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = _now()
+        return self
+
+    def __exit__(self, *exc):
+        end = _now()
+        _events.append({'name': self.name, 'ph': 'X', 'ts': self.start,
+            'dur': end - self.start, 'pid': os.getpid(), 'tid': 0})
+        # counters are sampled as a stage ends rather than on every
+        # count, which can happen millions of times per stage
+        if _counters:
+            _events.append({'name': 'counters', 'ph': 'C', 'ts': end,
+                'pid': os.getpid(), 'tid': 0, 'args': dict(_counters)})
+        return False
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name):
+    '''
+    Context manager timing its block as a stage called name
+    '''
+    return _Span(name) if _enabled else _NULL_SPAN
+
+def timed(name=None):
+    '''
+    Decorator timing every call of a function as a stage called name,
+    the function's name by default
+    '''
+    def decorate(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def timed_func(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(label):
+                return func(*args, **kwargs)
+        return timed_func
+    return decorate
+
+def counting(calc_error):
+    '''
+    Wraps a calc_error(segment, data) residual function so every call
+    counts a residual evaluation and the points the segment spans.
+    Returns calc_error itself when tracing is off
+    '''
+    if not _enabled:
+        return calc_error
+
+    def counted(segment, data=None):
+        count('residual evaluations')
+        count('residual points', segment[1][0] - segment[0][0] + 1)
+        return calc_error(segment, data)
+    return counted
+
+def summary():
+    '''
+    Total seconds and calls per stage and the counters as a dict
+    '''
+    stages = {}
+    for event in _events:
+        if event['ph'] != 'X':
+            continue
+        stage = stages.setdefault(event['name'], {'seconds': 0.0, 'calls': 0})
+        stage['seconds'] += event['dur'] / 1e6
+        stage['calls'] += 1
+    return {'stages': stages, 'counters': dict(_counters)}
+
+def write(path, format='chrome'):
+    '''
+    Writes the trace to path as a Chrome trace or a summary
+    '''
+    if format == 'chrome':
+        report = {'traceEvents': _events, 'displayTimeUnit': 'ms'}
+    elif format == 'summary':
+        report = summary()
+    else:
+        raise Exception(('Unknown trace format=', format))
+    with open(path, 'w') as out:
+        json.dump(report, out, indent=1, sort_keys=True)
@@ -0,0 +1,298 @@
+'''Pattern search index
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Nearest neighbour search over the standardized feature vectors of the
+sliding windows of many segmented time series, to find the windows of
+any symbol that look most like a given window or a snippet of raw
+prices.
+
+Vectors are kept in a scipy cKDTree. Windows inserted after the tree was
+built are searched by brute force until they make up rebuild_fraction
+of the indexed ones, then the tree is rebuilt over everything, so
+inserts stay cheap while queries stay logarithmic. Passing eps > 0 to
+the queries trades exactness for speed, as in cKDTree.query.
+
+Every series is standardized with the mean and std of its own features,
+as extract_features does, and windows appended to a series later reuse
+those statistics. Raw price snippets are standardized with the
+statistics of a given symbol, or those of all series pooled.
+
+add_matrix indexes the series of an on-disk FeatureMatrix a chunk of
+rows at a time, with the statistics it was built with.
+
+An index is saved as a directory of .npy files, which load memory-mapped,
+and a meta.json.
+'''
+
+import os
+import json
+import numpy as np
+from scipy.spatial import cKDTree
+import featextract as fex
+import preprocess as pp
+from segments import indices_of, values_of
+
+class PatternIndex(object):
+
+    def __init__(self, k, l,
+            compute_feature=fex.compute_jimmy_and_ricky_acf_features,
+            use_relative_err=False, rebuild_fraction=0.1):
+        '''
+        k and l are the segment and window lengths the indexed series
+        were, and query snippets will be, processed with
+        '''
+        self.k = k
+        self.l = l
+        self.compute_feature = compute_feature
+        self.use_relative_err = use_relative_err
+        self.rebuild_fraction = rebuild_fraction
+
+        self.symbols = []
+        # per symbol (window count, feature mean, feature std, last start)
+        self.stats = {}
+
+        # rows [0, count) are in use, arrays grow by doubling
+        self._vectors = None
+        self._symbol = None
+        self._start = None
+        self.count = 0
+
+        # rows [0, indexed) are in the tree
+        self.tree = None
+        self.indexed = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def vectors(self):
+        return self._vectors[:self.count]
+
+    def add_series(self, symbol, segd):
+        '''
+        Indexes the windows of segd, a Segments or a list of
+        (index, value) pairs.
+        For a symbol that is already indexed, only windows starting
+        after its last indexed window are added, assuming segd extends
+        the segmentation indexed before.
+
+        Returns the number of windows added.
+        '''
+        l = self.l
+        if l >= len(segd) or l < 1:
+            raise Exception(
+                ('Invalid window length=',l, ' with segmented data length=',len(segd)))
+
+        inds = indices_of(segd)
+        vals = values_of(segd)
+        starts = inds[:len(inds)-l+1]
+
+        if symbol in self.stats:
+            n, mean, std, last = self.stats[symbol]
+            first = np.searchsorted(starts, last, 'right')
+            raw = np.asarray(fex.compute_windows(vals[first:], l,
+                self.compute_feature), dtype=float)
+            starts = starts[first:]
+            self.stats[symbol] = (n + len(raw), mean, std,
+                starts[-1] if len(starts) else last)
+        else:
+            raw = np.asarray(fex.compute_windows(vals, l,
+                self.compute_feature), dtype=float)
+            mean = raw.mean(axis=0)
+            std = raw.std(axis=0)
+            self.symbols.append(symbol)
+            self.stats[symbol] = (len(raw), mean, std, starts[-1])
+
+        self.insert(symbol, (raw - mean) / std, starts)
+        return len(raw)
+
+    def add_matrix(self, matrix, chunk_rows=65536):
+        '''
+        Indexes every window of a FeatureMatrix built with the same l
+        and compute_feature, reading it chunk_rows rows at a time. Its
+        series are indexed under their names and must not be indexed
+        yet.
+
+        Returns the number of windows added.
+        '''
+        if matrix.l != self.l or matrix.compute_feature is not self.compute_feature:
+            raise Exception(('Feature matrix of l=', matrix.l, ' and ',
+                matrix.compute_feature.__name__, ' does not match the index'))
+
+        for i, symbol in enumerate(matrix.names):
+            if symbol in self.stats:
+                raise Exception(('Symbol ', symbol, ' is already indexed'))
+            a, b = matrix.offsets[i], matrix.offsets[i+1]
+            self.stats[symbol] = (b - a, matrix.mean[i], matrix.std[i],
+                int(matrix.start[b-1]))
+            for c in xrange(a, b, chunk_rows):
+                d = min(c + chunk_rows, b)
+                self.insert(symbol, matrix[c:d], matrix.start[c:d])
+
+        return len(matrix)
+
+    def insert(self, symbol, vectors, starts):
+        '''
+        Adds already standardized feature vectors of windows of
+        symbol starting at starts
+        '''
+        vectors = np.asarray(vectors, dtype=float)
+        n = len(vectors)
+        if n == 0:
+            return
+        if symbol not in self.symbols:
+            self.symbols.append(symbol)
+
+        if self._vectors is None:
+            self._vectors = np.empty((2*n, vectors.shape[1]))
+            self._symbol = np.empty(2*n, dtype=np.int64)
+            self._start = np.empty(2*n, dtype=np.int64)
+        elif self.count + n > len(self._vectors):
+            size = 2*(self.count + n)
+            self._vectors = self._grow(self._vectors, size)
+            self._symbol = self._grow(self._symbol, size)
+            self._start = self._grow(self._start, size)
+
+        rows = slice(self.count, self.count + n)
+        self._vectors[rows] = vectors
+        self._symbol[rows] = self.symbols.index(symbol)
+        self._start[rows] = starts
+        self.count += n
+
+        if self.count - self.indexed > self.rebuild_fraction * self.indexed:
+            self.rebuild()
+
+    def _grow(self, array, size):
+        grown = np.empty((size,) + array.shape[1:], dtype=array.dtype)
+        grown[:self.count] = array[:self.count]
+        return grown
+
+    def rebuild(self):
+        '''
+        Rebuilds the tree over every inserted window
+        '''
+        self.tree = cKDTree(self.vectors)
+        self.indexed = self.count
+
+    def query(self, vector, top=10, eps=0):
+        '''
+        The top windows closest to the standardized feature vector,
+        as a list of (distance, symbol, start) tuples, closest first
+        '''
+        dist, rows = self._nearest(np.asarray(vector, dtype=float), top, eps)
+        return [(d, self.symbols[self._symbol[r]], self._start[r])
+            for d, r in zip(dist, rows)]
+
+    def query_window(self, symbol, start, top=10, eps=0):
+        '''
+        The top windows closest to the indexed window of symbol
+        starting at start, leaving out that window itself
+        '''
+        rows = np.flatnonzero((self._symbol[:self.count] == self.symbols.index(symbol))
+            & (self._start[:self.count] == start))
+        if len(rows) == 0:
+            raise Exception(('No window of ', symbol, ' starts at ', start))
+        row = rows[0]
+
+        dist, found = self._nearest(self._vectors[row], top + 1, eps)
+        return [(d, self.symbols[self._symbol[r]], self._start[r])
+            for d, r in zip(dist, found) if r != row][:top]
+
+    def query_snippet(self, prices, top=10, symbol=None, eps=0):
+        '''
+        The top windows closest to the last window of prices, a list
+        of raw prices, segmented and featurized like the indexed series.
+        Features are standardized with the statistics of symbol, or of
+        all indexed series when symbol is None.
+        '''
+        # bottom_up needs 2*k prices for a single segment
+        segd = []
+        if len(prices) >= 2*self.k:
+            segd = pp.segment(list(prices), self.k, self.use_relative_err)
+        if len(segd) < self.l:
+            raise Exception(('Snippet of ', len(prices),
+                ' prices has fewer than l=', self.l, ' segments'))
+
+        vals = values_of(segd)[-self.l:]
+        raw = np.asarray(fex.compute_windows(vals, self.l,
+            self.compute_feature), dtype=float)[0]
+
+        mean, std = self._scale(symbol)
+        return self.query((raw - mean) / std, top, eps)
+
+    def _scale(self, symbol):
+        if symbol is not None:
+            n, mean, std, last = self.stats[symbol]
+            return mean, std
+
+        # pool the per series means and variances
+        n, mean, std, last = zip(*[self.stats[s] for s in self.symbols
+            if s in self.stats])
+        n = np.array(n, dtype=float)[:, None]
+        mean = np.array(mean)
+        total = n.sum()
+        pooled = (n * mean).sum(axis=0) / total
+        var = (n * (np.array(std)**2 + (mean - pooled)**2)).sum(axis=0) / total
+        return pooled, np.sqrt(var)
+
+    def _nearest(self, vector, top, eps):
+        # merges the tree's top hits with those among the windows
+        # inserted since it was built
+        dist = np.empty(0)
+        rows = np.empty(0, dtype=np.int64)
+        if self.tree is not None and self.indexed > 0:
+            dist, rows = self.tree.query(vector, min(top, self.indexed), eps=eps)
+            dist, rows = np.atleast_1d(dist), np.atleast_1d(rows)
+
+        if self.count > self.indexed:
+            pending = self._vectors[self.indexed:self.count]
+            pdist = np.sqrt(((pending - vector)**2).sum(axis=1))
+            dist = np.r_[dist, pdist]
+            rows = np.r_[rows, np.arange(self.indexed, self.count)]
+
+        order = np.argsort(dist, kind='mergesort')[:top]
+        return dist[order], rows[order]
+
+    def save(self, path):
+        '''
+        Writes the index to the directory at path
+        '''
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        np.save(os.path.join(path, 'vectors.npy'), self.vectors)
+        np.save(os.path.join(path, 'symbol.npy'), self._symbol[:self.count])
+        np.save(os.path.join(path, 'start.npy'), self._start[:self.count])
+
+        meta = {
+            'k': self.k, 'l': self.l,
+            'compute_feature': self.compute_feature.__name__,
+            'use_relative_err': self.use_relative_err,
+            'rebuild_fraction': self.rebuild_fraction,
+            'symbols': self.symbols,
+            'stats': dict((s, [int(n), list(mean), list(std), int(last)])
+                for s, (n, mean, std, last) in self.stats.items())}
+        with open(os.path.join(path, 'meta.json'), 'w') as out:
+            json.dump(meta, out)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Reads an index written by save, with the vectors memory-mapped
+        until the next insert
+        '''
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        index = cls(meta['k'], meta['l'],
+            getattr(fex, meta['compute_feature']),
+            meta['use_relative_err'], meta['rebuild_fraction'])
+        index.symbols = [str(s) for s in meta['symbols']]
+        index.stats = dict((str(s), (n, np.array(mean), np.array(std), last))
+            for s, (n, mean, std, last) in meta['stats'].items())
+
+        index._vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        index._symbol = np.load(os.path.join(path, 'symbol.npy'))
+        index._start = np.load(os.path.join(path, 'start.npy'))
+        index.count = len(index._vectors)
+        index.rebuild()
+        return index
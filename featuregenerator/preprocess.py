@@ -8,63 +8,105 @@ segmenting algorithm and extracts features.
 .csv import works with Yahoo Finance data. Remember to change the csv reader
 properties when processing data from other sources!
 '''
+import os
 import sys
-import csv
+import ingest
 import segmenter
+from segments import Segments
+import instrument
 import featextract as fex
 
-def csv_import(csvfile):
-    # assume csv rows are in reverse chronological order
-    # read csv into memory as a list of (INDEX,DATE,CLOSE_PRICE) tuples
-    reader = csv.DictReader(csvfile)
-    combined_data =  [(row['Date'], float(row['Close'])) for row in reader]
-
-    # truncate odd length data
-    if len(combined_data)%2 == 1:
-        combined_data = combined_data[:-1]
-
-    # extract dates and data into two separate lists
-    dates, data = zip(*combined_data)
-
-    # reverse order
-    data = data[::-1]
-    dates = dates[::-1]
+# the bundled Yahoo Finance csv files
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'data')
+
+def symbol_name(csvpath):
+    # yahoo-aapl-7458.csv holds aapl
+    name = os.path.splitext(os.path.basename(csvpath))[0]
+    parts = name.split('-')
+    if len(parts) == 3 and parts[0] == 'yahoo':
+        return parts[1]
+    return name
+
+@instrument.timed()
+def csv_import(csvfile, column='Close'):
+    if isinstance(csvfile, basestring):
+        # a path loads through the binary copy ingest keeps next to
+        # the csv, memory-mapped after the first load
+        dates, data = ingest.load_series(csvfile, column)
+        dates = dates.astype(str)
+    else:
+        # assume csv rows are in reverse chronological order
+        # split csv into a table of strings, one row per line
+        header, cells = ingest.read_columns(csvfile)
+        dates = cells[::-1, 0]
+        data = cells[::-1, header.index(column)].astype(float)
+    instrument.count('csv rows', len(data))
+
+    # truncate odd length data, dropping the oldest row
+    if len(data)%2 == 1:
+        dates = dates[1:]
+        data = data[1:]
+
+    data = tuple(data.tolist())
+    dates = tuple(dates.tolist())
     
     # enumerate it for the index
     return dates, data
 
+@instrument.timed()
 def remove_consecutive_duplicates(segd):
+    # drops, in place, every segment with the same value as the one
+    # before it from a Segments or a list of (index, value) pairs
+    if isinstance(segd, Segments):
+        segd.keep(~segd.duplicate_mask())
+        return
+
     prev = float('nan')
 
-    remove = []
+    keep = []
 
-    for i in xrange(len(segd)):
-        s = segd[i]
-        if s[1] == prev:
-            remove.append(i)
+    for s in segd:
+        if s[1] != prev:
+            keep.append(s)
         prev = s[1]
 
-    for i in remove[::-1]:
-        del segd[i] 
+    segd[:] = keep
 
-def gen_simple_features(inpath, k, l, 
-    use_relative_err=False,
-    max_error=float('inf')):
-    print("Running feature extraction with SEGMENTLENGTH " + str(k) + " and WINDOWLENGTH " + str(l))
-    
-    # import Yahoo stock data and dates
-    dates, data = csv_import(inpath)
-    # segment data
+@instrument.timed()
+def segment(data, k, use_relative_err=False, max_error=float('inf'),
+        method='bottom_up'):
+    # segment data with one of segmenter.SEGMENTERS, residuals
+    # come from prefix sums over the series
+    segmenter_func = segmenter.SEGMENTERS[method]
+    residuals = segmenter.PrefixSumResidual(data)
     if use_relative_err:
         print("Using relative error for segmenter")
-        segd = segmenter.bottom_up(data, k,
-            calc_error=segmenter.relative_sqr_residual, 
+        segd = segmenter_func(data, k,
+            calc_error=residuals.relative_sqr_residual, 
             max_error=max_error)
     else:
-        segd = segmenter.bottom_up(data,k,max_error=max_error)
+        segd = segmenter_func(data, k,
+            calc_error=residuals.sqr_residual,
+            max_error=max_error)
+    segd = Segments.from_pairs(segd)
     # remove consecutive duplicates to eliminate 
     # possibility of division by zero
     remove_consecutive_duplicates(segd)
+
+    return segd
+
+@instrument.timed()
+def gen_simple_features(inpath, k, l, 
+    use_relative_err=False,
+    max_error=float('inf'),
+    column='Close',
+    method='bottom_up'):
+    print("Running feature extraction with SEGMENTLENGTH " + str(k) + " and WINDOWLENGTH " + str(l))
+    
+    # import Yahoo stock data and dates
+    dates, data = csv_import(inpath, column)
+    segd = segment(data, k, use_relative_err, max_error, method)
     # generate features 
     features = fex.extract_features(segd, l)
 
@@ -10,8 +10,13 @@ properties when processing data from other sources!
 
 import csv
 import math
+import heapq
+import multiprocessing as mp
 import llist
 import heapdict as hd
+import numpy as np
+from indexheap import IndexedHeap
+import instrument
 
 def relative_sqr_residual(segment, data):
     '''
@@ -49,9 +54,216 @@ def sqr_residual(segment, data):
 
     return sum(sqr_residual)
 
+class PrefixSumResidual(object):
+    '''
+    Constant time residuals over a fixed series of values.
+
+    Precomputes cumulative sums of y, y^2 and i*y (and of the 1/y, i/y,
+    1/y^2, i/y^2 and i^2/y^2 weighted terms for the relative residual)
+    so the squared residual of any segment against the line through its
+    endpoints is a handful of lookups instead of a pass over the segment.
+
+    The sqr_residual and relative_sqr_residual methods take the same
+    (segment, data) arguments as the module level functions, so either
+    can be passed to bottom_up as calc_error, e.g.
+
+        engine = PrefixSumResidual(data)
+        bottom_up(data, k, calc_error=engine.sqr_residual)
+
+    The data argument is ignored, the sums are taken over the series
+    the engine was built with.
+
+    Segments spanning fewer than exact_below points are summed directly
+    so their (small) residuals come out bit for bit the same as the
+    module level functions, longer ones agree to floating point
+    tolerance.
+    '''
+
+    def __init__(self, data, exact_below=16):
+        y = np.asarray(data, dtype=float)
+        i = np.arange(len(y), dtype=float)
+
+        self.y = self._prefix(y)
+        self.yy = self._prefix(y*y)
+        self.iy = self._prefix(i*y)
+
+        # short segments have residuals small enough that the
+        # cancellation in the expanded sums would swamp them
+        self.exact_below = exact_below
+        self.data = list(data)
+
+        # the relative sums and the arrays for the vectorized
+        # residuals are only built when first needed
+        self._relative = None
+        self._arrays = {}
+
+    @staticmethod
+    def _prefix(values):
+        # P[k] holds the sum of values[:k], accumulated in extended
+        # precision and split into a (hi, lo) pair of float lists so
+        # that P[b] - P[a] keeps its precision far into the series.
+        # lists, since indexing python floats is much faster than
+        # indexing numpy scalars one at a time
+        acc = np.zeros(len(values) + 1, dtype=np.longdouble)
+        np.cumsum(values, dtype=np.longdouble, out=acc[1:])
+        hi = acc.astype(float)
+        lo = (acc - hi).astype(float)
+        return hi.tolist(), lo.tolist()
+
+    @staticmethod
+    def _range(prefix, a, b):
+        # sum of the underlying values over [a, b)
+        hi, lo = prefix
+        return (hi[b] - hi[a]) + (lo[b] - lo[a])
+
+    def _range_many(self, prefix, a, b):
+        # _range for arrays of a and b
+        key = id(prefix)
+        if key not in self._arrays:
+            self._arrays[key] = (np.array(prefix[0]), np.array(prefix[1]))
+        hi, lo = self._arrays[key]
+        return (hi[b] - hi[a]) + (lo[b] - lo[a])
+
+    def _endpoints(self, starts, ends):
+        if 'values' not in self._arrays:
+            self._arrays['values'] = np.array(self.data, dtype=float)
+        values = self._arrays['values']
+        a = np.asarray(starts, dtype=np.int64)
+        b = np.asarray(ends, dtype=np.int64)
+        return a, b, values[a], values[b]
+
+    def _relative_sums(self):
+        if self._relative is None:
+            y = np.asarray(self.data, dtype=np.longdouble)
+            i = np.arange(len(y), dtype=np.longdouble)
+            with np.errstate(divide='ignore'):
+                w = 1.0 / y
+            w2 = w*w
+            self._relative = (self._prefix(w), self._prefix(i*w),
+                self._prefix(w2), self._prefix(i*w2), self._prefix(i*i*w2))
+        return self._relative
+
+    def sqr_residual(self, segment, data=None):
+        '''
+        Same as the module level sqr_residual in O(1)
+        '''
+        a, va = segment[0]
+        b, vb = segment[1]
+        n = b - a
+        if n < self.exact_below:
+            return sqr_residual(segment, self.data)
+        m = (vb - va) / n
+
+        # interior points are a+1..b-1, i.e. t = 1..n-1 with i = a+t
+        lo = a + 1
+        c = n - 1
+        st = 0.5 * c * n
+        stt = c * n * (2*n - 1) / 6.0
+
+        sy = self._range(self.y, lo, b)
+        syy = self._range(self.yy, lo, b)
+        sty = self._range(self.iy, lo, b) - a*sy
+
+        # sum over t of (va + m*t - y)^2 expanded
+        pp = c*va*va + 2*va*m*st + m*m*stt
+        py = va*sy + m*sty
+        res = pp - 2*py + syy
+
+        return res if res > 0 else 0.0
+
+    def relative_sqr_residual(self, segment, data=None):
+        '''
+        Same as the module level relative_sqr_residual in O(1)
+        '''
+        a, va = segment[0]
+        b, vb = segment[1]
+        n = b - a
+        if n < self.exact_below:
+            return relative_sqr_residual(segment, self.data)
+        m = (vb - va) / n
+
+        lo = a + 1
+        c = n - 1
+        w, iw, w2, iw2, iiw2 = self._relative_sums()
+
+        sw = self._range(w, lo, b)
+        stw = self._range(iw, lo, b) - a*sw
+        sw2 = self._range(w2, lo, b)
+        siw2 = self._range(iw2, lo, b)
+        stw2 = siw2 - a*sw2
+        sttw2 = self._range(iiw2, lo, b) - 2*a*siw2 + a*a*sw2
+
+        # sum over t of ((va + m*t)/y - 1)^2 expanded
+        pp = va*va*sw2 + 2*va*m*stw2 + m*m*sttw2
+        p = va*sw + m*stw
+        res = pp - 2*p + c
+
+        return res if res > 0 else 0.0
+
+    def sqr_residuals(self, starts, ends):
+        '''
+        sqr_residual of the segments from starts[i] to ends[i] for all
+        i at once, as an array. Short segments are not summed exactly,
+        so these agree with sqr_residual to floating point tolerance
+        '''
+        a, b, va, vb = self._endpoints(starts, ends)
+        n = (b - a).astype(float)
+        m = (vb - va) / n
+
+        c = n - 1
+        st = 0.5 * c * n
+        stt = c * n * (2*n - 1) / 6.0
+
+        sy = self._range_many(self.y, a + 1, b)
+        syy = self._range_many(self.yy, a + 1, b)
+        sty = self._range_many(self.iy, a + 1, b) - a*sy
+
+        pp = c*va*va + 2*va*m*st + m*m*stt
+        py = va*sy + m*sty
+        return np.maximum(pp - 2*py + syy, 0.0)
+
+    def relative_sqr_residuals(self, starts, ends):
+        '''
+        relative_sqr_residual of many segments, see sqr_residuals
+        '''
+        a, b, va, vb = self._endpoints(starts, ends)
+        n = (b - a).astype(float)
+        m = (vb - va) / n
+
+        c = n - 1
+        w, iw, w2, iw2, iiw2 = self._relative_sums()
+
+        sw = self._range_many(w, a + 1, b)
+        stw = self._range_many(iw, a + 1, b) - a*sw
+        sw2 = self._range_many(w2, a + 1, b)
+        siw2 = self._range_many(iw2, a + 1, b)
+        stw2 = siw2 - a*sw2
+        sttw2 = self._range_many(iiw2, a + 1, b) - 2*a*siw2 + a*a*sw2
+
+        pp = va*va*sw2 + 2*va*m*stw2 + m*m*sttw2
+        p = va*sw + m*stw
+        return np.maximum(pp - 2*p + c, 0.0)
+
+def residuals_of(calc_error, data):
+    '''
+    A function of (starts, ends) arrays giving the residuals of all
+    those segments of data at once. Uses the vectorized method when
+    calc_error is a PrefixSumResidual method and falls back to calling
+    calc_error per segment otherwise
+    '''
+    engine = getattr(calc_error, '__self__', None)
+    if isinstance(engine, PrefixSumResidual):
+        return getattr(engine, calc_error.__name__ + 's')
+
+    def residuals(starts, ends):
+        return np.array([calc_error(((a, data[a]), (b, data[b])), data)
+            for a, b in zip(starts, ends)], dtype=float)
+    return residuals
+
 def merge_segs(seg1, seg2):
     return (seg1[0], seg2[1])
 
+@instrument.timed()
 def bottom_up(data, k, calc_error=sqr_residual, max_error=float('inf')):
     '''
     Merge time series data points to produce trend segments
@@ -73,6 +285,8 @@ def bottom_up(data, k, calc_error=sqr_residual, max_error=float('inf')):
     Returns a subset of the data in the form of [(index, value)].
     '''
 
+    calc_error = instrument.counting(calc_error)
+
     ## INITIALIZATION STEP
     n = len(data)
 
@@ -129,6 +343,7 @@ def bottom_up(data, k, calc_error=sqr_residual, max_error=float('inf')):
         # remove old pair from pairs linked list
         pairs.remove(pair)
 
+    instrument.count('merges', len(segments) - 1 - len(pairs))
 
     # form a list of (index, value) keeping 
     # only the values after being segmented
@@ -146,3 +361,727 @@ def bottom_up(data, k, calc_error=sqr_residual, max_error=float('inf')):
     segmented_data.append(pairs.last.value[1][1])
 
     return segmented_data
+
+@instrument.timed()
+def bottom_up_array(data, k, calc_error=sqr_residual, max_error=float('inf')):
+    '''
+    Same merges and output as bottom_up, but the pairs of segments live
+    in flat NumPy arrays instead of llist nodes holding nested tuples,
+    and the residuals in an IndexedHeap instead of a heapdict.
+
+    Pair p is the segment [lstart[p], lend[p]] followed by the segment
+    [lend[p]+1, rend[p]], and prev[p]/next[p] link the surviving pairs
+    (-1 at either end). A merge only rewrites a few integers in place.
+
+    calc_error is called with the same ((index, value), (index, value))
+    segments as in bottom_up, so any of the residual functions work.
+
+    The output matches bottom_up except where several pairs tie for the
+    smallest residual: heapdict then picks one arbitrarily while the
+    IndexedHeap always merges the left-most.
+    '''
+    calc_error = instrument.counting(calc_error)
+    n = len(data)
+    npairs = n/2 - 1
+
+    ## INITIALIZATION STEP
+    # pair p joins the length 2 segments starting at 2p and 2p+2
+    lstart = np.arange(0, 2*npairs, 2, dtype=np.int64)
+    lend = lstart + 1
+    rend = lstart + 3
+    prev = np.arange(-1, npairs - 1, dtype=np.int64)
+    next = np.arange(1, npairs + 1, dtype=np.int64)
+    if npairs > 0:
+        next[-1] = -1
+
+    res = [calc_error(((2*p, data[2*p]), (2*p+3, data[2*p+3])), data)
+        for p in xrange(npairs)]
+    res_heap = IndexedHeap(res)
+
+    ## MERGE STEP
+    count = npairs
+    first = 0
+    while count > n/k and count > 1:
+        p, res = res_heap.pop()
+        if res > max_error:
+            break
+
+        start = lstart[p]
+        end = rend[p]
+
+        # the left pair's right segment becomes the merged segment
+        left = prev[p]
+        if left >= 0:
+            rend[left] = end
+            s = lstart[left]
+            res_heap.update(left,
+                calc_error(((s, data[s]), (end, data[end])), data))
+            next[left] = next[p]
+        else:
+            first = next[p]
+
+        # the right pair's left segment becomes the merged segment
+        right = next[p]
+        if right >= 0:
+            lstart[right] = start
+            lend[right] = end
+            e = rend[right]
+            res_heap.update(right,
+                calc_error(((start, data[start]), (e, data[e])), data))
+            prev[right] = left
+
+        count -= 1
+
+    instrument.count('merges', npairs - count)
+
+    # form a list of (index, value) keeping 
+    # only the values after being segmented
+    segmented_data = []
+    p = last = first
+    while p >= 0:
+        s = int(lstart[p])
+        e = int(lend[p])
+        segmented_data.append((s, data[s]))
+        segmented_data.append((e, data[e]))
+        last = p
+        p = next[p]
+
+    # add the last data point
+    e = int(rend[last])
+    segmented_data.append((e, data[e]))
+
+    return segmented_data
+
+def breakpoints(bounds, data):
+    '''
+    Given the [start, end] index bounds of consecutive segments, returns
+    the [(index, value)] list bottom_up would give for them: both ends
+    of every segment but the last, then the end of the last one. A
+    single segment gives both of its ends
+    '''
+    segmented_data = []
+    for start, end in bounds[:-1]:
+        segmented_data.append((start, data[start]))
+        segmented_data.append((end, data[end]))
+    start, end = bounds[-1]
+    if len(bounds) == 1:
+        segmented_data.append((start, data[start]))
+    segmented_data.append((end, data[end]))
+    return segmented_data
+
+@instrument.timed()
+def top_down(data, k, calc_error=sqr_residual, max_error=float('inf')):
+    '''
+    Splits the series in two at the point giving the smallest total
+    residual, then keeps splitting the segment with the largest residual
+    until there are as many segments as bottom_up(data, k) leaves and
+    none has a residual above max_error (segments of three points cannot
+    be split further and may still go over).
+
+    Covers the same points as bottom_up (the last value of odd length
+    data is dropped), every segment spans at least two of them and the
+    output has the same [(index, value)] form.
+
+    Every split point of a segment is tried, which is O(1) per point
+    and vectorized when calc_error is a PrefixSumResidual method, so
+    the whole run is O(n log(n/k)).
+    '''
+    residuals = residuals_of(calc_error, data)
+    n = len(data) - len(data) % 2
+    target = n/k + 1
+
+    def error(start, end):
+        return residuals([start], [end])[0]
+
+    # max heap of (-residual, start, end) over segments that can still
+    # be split into two of at least two points each
+    bounds = []
+    heap = []
+    def add(start, end):
+        if end - start >= 3:
+            heapq.heappush(heap, (-error(start, end), start, end))
+        else:
+            bounds.append((start, end))
+
+    add(0, n - 1)
+    count = 1
+    while heap:
+        res, start, end = heap[0]
+        if count >= target and -res <= max_error:
+            break
+        heapq.heappop(heap)
+
+        # left is [start, c], right is [c+1, end]
+        c = np.arange(start + 1, end - 1)
+        costs = residuals(np.full(len(c), start), c) + residuals(c + 1, np.full(len(c), end))
+        split = int(c[np.argmin(costs)])
+        add(start, split)
+        add(split + 1, end)
+        count += 1
+
+    instrument.count('splits', count - 1)
+    bounds.extend((start, end) for res, start, end in heap)
+    return breakpoints(sorted(bounds), data)
+
+@instrument.timed()
+def sliding_window(data, k, calc_error=sqr_residual, max_error=float('inf')):
+    '''
+    Grows every segment from the end of the previous one for as long as
+    its residual stays at most a threshold.
+
+    The threshold is bisected so the output has about as many segments
+    as bottom_up(data, k), at most that many when it can be reached.
+    As in bottom_up, a finite max_error caps the threshold, so segments
+    never go over it even when that takes more segments than that.
+
+    Covers the same points as bottom_up and every segment spans at
+    least two of them. Residuals are computed a block of candidate ends
+    at a time, vectorized when calc_error is a PrefixSumResidual method.
+    '''
+    residuals = residuals_of(calc_error, data)
+    n = len(data) - len(data) % 2
+
+    target = n/k + 1
+    whole = residuals([0], [n - 1])[0]
+    if max_error < whole:
+        # every segment within max_error, stop there if that already
+        # takes target segments or more
+        hi = max_error
+        best = _slide(residuals, n, max_error)
+        if len(best) >= target:
+            return breakpoints(best, data)
+    else:
+        # the residual of the whole series always fits in one segment
+        hi = whole
+        best = [(0, n - 1)]
+    lo = 0.0
+    for it in xrange(40):
+        threshold = (lo + hi) / 2
+        bounds = _slide(residuals, n, threshold, target)
+        if bounds is not None:
+            best = bounds
+            hi = threshold
+        else:
+            lo = threshold
+        if len(best) == target or hi - lo <= 1e-9 * hi:
+            break
+    return breakpoints(best, data)
+
+def _slide(residuals, n, threshold, most=None, block=64):
+    # one sliding window pass over [0, n), None once it needs more
+    # than most segments
+    bounds = []
+    start = 0
+    while start < n - 1:
+        if most is not None and len(bounds) >= most:
+            return None
+        # the segment always takes its first two points, then grows a
+        # block of candidate ends at a time until one goes over
+        end = start + 1
+        size = block
+        while end < n - 1:
+            ends = np.arange(end + 1, min(end + 1 + size, n))
+            over = np.flatnonzero(
+                residuals(np.full(len(ends), start), ends) > threshold)
+            if len(over):
+                end = int(ends[over[0]]) - 1
+                break
+            end = int(ends[-1])
+            size *= 2
+        # a single point left over joins the last segment
+        if end == n - 2:
+            end = n - 1
+        bounds.append((start, end))
+        start = end + 1
+    return bounds
+
+class SWAB(object):
+    '''
+    Sliding Window And Bottom-up segmenter for streaming data.
+
+    Values are pushed one at a time into a buffer of buffer_size points.
+    Whenever the buffer is full it is segmented with bottom_up and only
+    the left-most segment is finalized: its (index, value) endpoints are
+    returned from push and its points dropped from the buffer, which then
+    keeps filling from the feed. flush() segments whatever is left once
+    the feed ends.
+
+    Indices count pushed values from 0, so concatenating the output of
+    every push and the final flush gives a list in the same form as
+    bottom_up(data, k) over all the pushed values, e.g.
+
+        swab = SWAB(k)
+        segd = []
+        for value in feed:
+            segd.extend(swab.push(value))
+        segd.extend(swab.flush())
+
+    Memory is bounded by buffer_size values. Differences to bottom_up
+    over the whole series are bounded as follows:
+        - no segment spans more than buffer_size points, since every
+          segment comes from a bottom_up run over a single buffer
+        - with a finite max_error every segment still has a residual of
+          at most max_error, exactly as in bottom_up
+        - each finalized segment is the first of about buffer_size/k
+          segments, so the segment budget cannot move between distant
+          parts of the series. On the bundled data with k = 10 the
+          default buffer gives 11-14% more segments than bottom_up
+          (4-7% with buffer_size = 32*k). With relative_sqr_residual
+          the total residual is within 30% of bottom_up's, with
+          sqr_residual it can be several times larger on series whose
+          price level grows by orders of magnitude, as bottom_up
+          spends most segments where prices are highest.
+    '''
+
+    def __init__(self, k, buffer_size=None, calc_error=sqr_residual,
+            max_error=float('inf')):
+        if buffer_size is None:
+            buffer_size = 8*k
+        if buffer_size < 2*k or buffer_size < 4:
+            raise Exception(
+                ('Invalid buffer size=', buffer_size, ' with segment length=', k))
+
+        self.k = k
+        self.buffer_size = buffer_size
+        self.calc_error = calc_error
+        self.max_error = max_error
+
+        # buffered values and the index of the first one
+        self.values = []
+        self.offset = 0
+
+    def push(self, value):
+        '''
+        Adds the next value of the series, returns the list of
+        (index, value) breakpoints finalized by it (usually empty)
+        '''
+        self.values.append(value)
+        if len(self.values) < self.buffer_size:
+            return []
+
+        segd = bottom_up(self.values, self.k,
+            calc_error=self.calc_error, max_error=self.max_error)
+
+        # keep only the left-most segment, the rest may still change
+        # as more data arrives
+        start, end = segd[0], segd[1]
+        finalized = [(self.offset + start[0], start[1]),
+            (self.offset + end[0], end[1])]
+
+        del self.values[:end[0] + 1]
+        self.offset += end[0] + 1
+
+        return finalized
+
+    def flush(self):
+        '''
+        Segments and returns the remaining buffered values as
+        (index, value) breakpoints, leaving the buffer empty
+        '''
+        values = self.values
+        offset = self.offset
+
+        if len(values) >= max(2*self.k, 4):
+            segd = bottom_up(values, self.k,
+                calc_error=self.calc_error, max_error=self.max_error)
+        elif values:
+            # too short for bottom_up to make a single segment of k
+            # points, keep the first value, the last is added below
+            segd = [(0, values[0])]
+        else:
+            return []
+
+        self.values = []
+        self.offset += len(values)
+
+        # bottom_up drops the last value of odd length data
+        if segd[-1][0] != len(values) - 1:
+            segd.append((len(values) - 1, values[-1]))
+
+        return [(offset + i, v) for i, v in segd]
+
+@instrument.timed()
+def swab(data, k, calc_error=sqr_residual, max_error=float('inf'),
+        buffer_size=None):
+    '''
+    SWAB over a whole series, with the same arguments and output form
+    as bottom_up. Segments cover every point, including the last value
+    of odd length data.
+
+    calc_error gets segments indexed into data and data itself, so the
+    methods of a PrefixSumResidual over data work here too.
+    '''
+    engine = SWAB(k, buffer_size, max_error=max_error)
+
+    # the buffered bottom_up runs index into the buffer
+    def buffered_error(segment, values):
+        (a, va), (b, vb) = segment
+        offset = engine.offset
+        return calc_error(((offset + a, va), (offset + b, vb)), data)
+    engine.calc_error = buffered_error
+
+    segd = []
+    for value in data:
+        segd.extend(engine.push(value))
+    segd.extend(engine.flush())
+    return segd
+
+def direct_residuals(values, starts, ends, relative=False, block=1 << 22):
+    '''
+    Residuals of the segments [starts[i], ends[i]] of the values array,
+    summed point by point like the module level functions but vectorized
+    over about block points at a time, so no prefix sums over the whole
+    series are needed and memory stays bounded
+    '''
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    out = np.zeros(len(starts))
+    # only the points strictly inside a segment contribute
+    inner = np.maximum(ends - starts - 1, 0)
+    total = np.cumsum(inner)
+
+    first = 0
+    while first < len(starts):
+        done = total[first - 1] if first else 0
+        last = max(first + 1, np.searchsorted(total, done + block, 'right'))
+        s = starts[first:last]
+        e = ends[first:last]
+        n = inner[first:last]
+
+        seg = np.repeat(np.arange(len(s)), n)
+        # i runs 1..n-1 within every segment, as in sqr_residual
+        i = np.arange(len(seg)) - np.repeat(np.cumsum(n) - n, n) + 1
+        m = (values[e] - values[s]) / (e - s)
+        value = values[s[seg] + i]
+        diff = values[s][seg] + m[seg]*i - value
+        if relative:
+            diff /= value
+        out[first:last] = np.bincount(seg, diff*diff, minlength=len(s))
+        first = last
+    return out
+
+def _residual_kind(calc_error, caller):
+    # True for the relative square residual, the function or the
+    # PrefixSumResidual method, False for the plain one
+    name = getattr(calc_error, '__name__', None)
+    if name not in ('sqr_residual', 'relative_sqr_residual'):
+        raise Exception(('Cannot run ', caller, ' with calc_error=', calc_error))
+    return name == 'relative_sqr_residual'
+
+@instrument.timed()
+def bottom_up_batch(data, offsets, k, calc_error=sqr_residual,
+        max_error=float('inf')):
+    '''
+    bottom_up over many series at once, for universes of short series
+    where calling bottom_up per series is mostly python overhead.
+
+    data holds the series one after another, series s being
+    data[offsets[s]:offsets[s+1]], and every series needs at least four
+    points. Returns (indices, values, bounds): the breakpoints of
+    series s, as bottom_up gives them, are
+        zip(indices[bounds[s]:bounds[s+1]], values[bounds[s]:bounds[s+1]])
+    with indices counted from the start of the series.
+
+    The merges are those of bottom_up_array(series, k, calc_error,
+    max_error) for every series, ties included. Instead of a heap per
+    series, the pairs of a group of series of similar length share one
+    padded array of residuals, row s holding the pairs of series s with
+    the same ids as in bottom_up_array. Every round merges the
+    cheapest pair of every series not yet done, found with one argmin
+    over the rows, and recomputes the residuals of all the neighbouring
+    pairs in one vectorized call. So there are about as many rounds as
+    the longest series of a group has pairs, and each round is a fixed
+    number of NumPy operations.
+
+    calc_error must be sqr_residual or relative_sqr_residual, the module
+    functions or PrefixSumResidual methods; residuals are summed
+    directly over data as the module functions do.
+    '''
+    relative = _residual_kind(calc_error, 'bottom_up_batch')
+    values = np.asarray(data, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    if (lengths < 4).any():
+        raise Exception(('Every series needs at least 4 points, series ',
+            np.flatnonzero(lengths < 4)[0], ' has ', lengths.min()))
+
+    # groups of series whose pair counts are within a factor of two,
+    # so padding at most doubles the work
+    npairs = lengths/2 - 1
+    groups = np.log2(npairs).astype(int)
+
+    found = [None] * len(lengths)
+    for group in np.unique(groups):
+        members = np.flatnonzero(groups == group)
+        rows = _merge_rows(values, offsets[members], lengths[members], k,
+            relative, max_error)
+        for s, inds in zip(members, rows):
+            found[s] = inds
+
+    counts = [len(inds) for inds in found]
+    bounds = np.r_[0, np.cumsum(counts)].astype(np.int64)
+    indices = np.concatenate(found)
+    values = values[indices + np.repeat(offsets[:-1], counts)]
+    return indices, values, bounds
+
+def _merge_rows(values, first, n, k, relative, max_error):
+    # bottom_up_array over the series values[first[r]:first[r]+n[r]]
+    # for every row r in lockstep, see bottom_up_batch. Pair arrays are
+    # as in bottom_up_array, padded to the longest series, with indices
+    # into values and prev/next holding columns
+    rows = len(first)
+    npairs = n/2 - 1
+    width = npairs.max()
+    col = np.arange(width, dtype=np.int64)
+    valid = col < npairs[:, None]
+
+    ## INITIALIZATION STEP
+    lstart = first[:, None] + 2*col
+    lend = lstart + 1
+    rend = lstart + 3
+    prev = np.tile(col - 1, (rows, 1))
+    next = np.tile(col + 1, (rows, 1))
+    next[col >= npairs[:, None] - 1] = -1
+
+    key = np.full((rows, width), np.inf)
+    key[valid] = direct_residuals(values, lstart[valid], rend[valid], relative)
+    alive = valid.copy()
+
+    ## MERGE STEP
+    count = npairs.copy()
+    target = n/k
+    active = np.flatnonzero((count > target) & (count > 1))
+    merges = 0
+    while len(active):
+        p = key[active].argmin(axis=1)
+        # a series is done once its cheapest merge costs too much
+        go = key[active, p] <= max_error
+        active = active[go]
+        p = p[go]
+        if len(active) == 0:
+            break
+
+        start = lstart[active, p]
+        end = rend[active, p]
+        left = prev[active, p]
+        right = next[active, p]
+        key[active, p] = np.inf
+        alive[active, p] = False
+
+        # the left pair's right segment becomes the merged segment
+        has = left >= 0
+        r = active[has]
+        c = left[has]
+        rend[r, c] = end[has]
+        next[r, c] = right[has]
+        key[r, c] = direct_residuals(values, lstart[r, c], end[has], relative)
+
+        # the right pair's left segment becomes the merged segment
+        has = right >= 0
+        r = active[has]
+        c = right[has]
+        lstart[r, c] = start[has]
+        lend[r, c] = end[has]
+        prev[r, c] = left[has]
+        key[r, c] = direct_residuals(values, start[has], rend[r, c], relative)
+
+        count[active] -= 1
+        merges += len(active)
+        active = active[(count[active] > target[active]) & (count[active] > 1)]
+
+    instrument.count('merges', merges)
+
+    # both ends of every surviving pair's left segment, in order, then
+    # the end of the last pair's right segment
+    r, c = np.nonzero(alive)
+    survivors = alive.sum(axis=1)
+    out = np.r_[0, np.cumsum(2*survivors + 1)]
+    j = np.arange(len(r)) - np.repeat(np.cumsum(survivors) - survivors, survivors)
+    pos = out[r] + 2*j
+    inds = np.empty(out[-1], dtype=np.int64)
+    inds[pos] = lstart[r, c] - first[r]
+    inds[pos + 1] = lend[r, c] - first[r]
+    last = np.cumsum(survivors) - 1
+    inds[out[1:] - 1] = rend[r[last], c[last]] - first
+    return np.split(inds, out[1:-1])
+
+# the series parallel_bottom_up shares with its chunk workers
+_shared = None
+
+def _share(array):
+    global _shared
+    _shared = array
+
+def _segment_chunk(task):
+    # [start, end] bounds of the bottom_up segments of one chunk
+    lo, hi, k, error, max_error = task
+    values = np.frombuffer(_shared, dtype=float)[lo:hi].tolist()
+    engine = PrefixSumResidual(values)
+    segd = bottom_up_array(values, k, getattr(engine, error), max_error)
+
+    # inverse of breakpoints
+    inds = [i for i, v in segd]
+    bounds = zip(inds[:-1:2], inds[1:-1:2])
+    bounds.append((inds[-2] + 1, inds[-1]))
+    return lo + np.array(bounds, dtype=np.int64)
+
+def _stitch(chunks, cuts):
+    # keeps the segments of chunk i starting in its core
+    # [cuts[i], cuts[i+1]), the first one cut short where the last one
+    # kept from the chunk before ends
+    starts = []
+    ends = []
+    last = -1
+    for i, bounds in enumerate(chunks):
+        s = bounds[:, 0]
+        e = bounds[:, 1]
+        keep = e > last
+        if i < len(chunks) - 1:
+            keep &= s < cuts[i + 1]
+        s = s[keep]
+        e = e[keep]
+        if len(s) == 0:
+            continue
+
+        s[0] = max(s[0], last + 1)
+        if s[0] == e[0]:
+            # a single point is left, it joins the segment before
+            ends[-1][-1] = e[0]
+            last = e[0]
+            s = s[1:]
+            e = e[1:]
+            if len(s) == 0:
+                continue
+
+        starts.append(s)
+        ends.append(e)
+        last = e[-1]
+    return np.concatenate(starts), np.concatenate(ends)
+
+def _remerge(values, starts, ends, target, relative, max_error):
+    # bottom-up merging of the stitched segments down to target, the
+    # pair of segments j and next[j] is id j in the heap
+    count = len(starts)
+    next = np.arange(1, count + 1, dtype=np.int64)
+    next[-1] = -1
+    prev = np.arange(-1, count - 1, dtype=np.int64)
+
+    merges = 0
+    if count > target:
+        # every merge updates two residuals, in O(1) from prefix sums
+        engine = PrefixSumResidual(values)
+        calc_error = (engine.relative_sqr_residual if relative
+            else engine.sqr_residual)
+        def error(start, end):
+            return calc_error(((start, engine.data[start]),
+                (end, engine.data[end])))
+
+        res_heap = IndexedHeap(direct_residuals(values, starts[:-1], ends[1:],
+            relative))
+        while count > target and len(res_heap):
+            j, res = res_heap.peek()
+            if res > max_error:
+                break
+
+            # segment j takes over the one after it
+            r = next[j]
+            ends[j] = ends[r]
+            next[j] = next[r]
+            if next[j] >= 0:
+                prev[next[j]] = j
+                res_heap.remove(r)
+                res_heap.update(j, error(starts[j], ends[next[j]]))
+            else:
+                res_heap.remove(j)
+            left = prev[j]
+            if left >= 0:
+                res_heap.update(left, error(starts[left], ends[j]))
+
+            count -= 1
+            merges += 1
+
+    instrument.count('boundary merges', merges)
+
+    bounds = []
+    j = 0
+    while j >= 0:
+        bounds.append((int(starts[j]), int(ends[j])))
+        j = next[j]
+    return bounds
+
+@instrument.timed()
+def parallel_bottom_up(data, k, calc_error=sqr_residual,
+        max_error=float('inf'), processes=None, chunk_size=1 << 20,
+        overlap=None, slack=1.0):
+    '''
+    bottom_up over chunks of chunk_size points on a pool of processes,
+    for series too long for a single heap.
+
+    The series is copied once into shared memory that the workers
+    inherit, and every chunk is segmented together with overlap points
+    (16*k by default) on either side. Of each chunk only the segments
+    starting in its own part are kept, the first cut short where the
+    chunk before ends, so the overlap lets segments settle before the
+    cut instead of ending at the chunk edge.
+
+    Workers leave 1 + slack times as many segments as bottom_up would,
+    and the stitched segments are then merged bottom-up once more,
+    cheapest pair first across the whole series, down to as many
+    segments as bottom_up(data, k) leaves and never merging a pair with
+    a residual above max_error. Those last merges run in this process,
+    about slack/(1 + slack) * n/k of them, and let segments move between
+    chunks: with slack = 0 every chunk keeps its own share, which with
+    sqr_residual costs a lot wherever the price level changes a lot
+    from chunk to chunk.
+
+    calc_error must be sqr_residual or relative_sqr_residual, the module
+    functions or PrefixSumResidual methods, as the workers build their
+    own PrefixSumResidual per chunk. Series no longer than one chunk are
+    segmented in process with bottom_up_array.
+
+    Covers the same points as bottom_up with the same output form, but
+    segments near the cuts may differ; benchmarks/parallel.py measures
+    by how much.
+    '''
+    relative = _residual_kind(calc_error, 'parallel_bottom_up')
+    error = 'relative_sqr_residual' if relative else 'sqr_residual'
+
+    if overlap is None:
+        overlap = 16*k
+    # even cuts keep every chunk even, so bottom_up drops no points
+    chunk_size += chunk_size % 2
+    overlap += overlap % 2
+    n = len(data) - len(data) % 2
+    if n <= chunk_size + overlap:
+        return bottom_up_array(data, k, calc_error, max_error)
+
+    shared = mp.RawArray('d', n)
+    values = np.frombuffer(shared, dtype=float)
+    values[:] = data[:n]
+
+    cuts = range(0, n, chunk_size) + [n]
+    tasks = [(max(0, a - overlap), min(n, b + overlap), k / (1.0 + slack),
+        error, max_error)
+        for a, b in zip(cuts[:-1], cuts[1:])]
+    instrument.count('chunks', len(tasks))
+
+    pool = mp.Pool(processes, initializer=_share, initargs=(shared,))
+    try:
+        chunks = pool.map(_segment_chunk, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    starts, ends = _stitch(chunks, cuts)
+    bounds = _remerge(values, starts, ends, n/k + 1, relative, max_error)
+    return breakpoints(bounds, data)
+
+# segmenters by name, all called as f(data, k, calc_error, max_error)
+SEGMENTERS = {
+    'bottom_up': bottom_up,
+    'bottom_up_array': bottom_up_array,
+    'top_down': top_down,
+    'sliding_window': sliding_window,
+    'swab': swab,
+    'parallel_bottom_up': parallel_bottom_up,
+}
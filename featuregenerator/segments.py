@@ -0,0 +1,94 @@
+'''Segmented time series
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Segments holds a segmented time series as two parallel NumPy arrays,
+the indices into the original series of the segment end points and the
+values there, instead of a list of (index, value) tuples that every
+consumer has to unzip again.
+
+For code written against the list form, a Segments also behaves as a
+read-only sequence of (index, value) tuples: len, indexing, iteration
+and zip(*segd) work as before and pairs() returns the list itself.
+Slicing returns another Segments sharing the arrays.
+'''
+
+import numpy as np
+
+class Segments(object):
+
+    def __init__(self, indices, values):
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.values = np.asarray(values, dtype=float)
+        if self.indices.shape != self.values.shape:
+            raise Exception(('Mismatched segment indices ', self.indices.shape,
+                ' and values ', self.values.shape))
+
+    @classmethod
+    def from_pairs(cls, segd):
+        '''
+        Segments of a list of (index, value) pairs
+        '''
+        if len(segd) == 0:
+            return cls([], [])
+        indices, values = zip(*segd)
+        return cls(indices, values)
+
+    def pairs(self):
+        '''
+        The segments as a list of (index, value) tuples
+        '''
+        return zip(self.indices.tolist(), self.values.tolist())
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return Segments(self.indices[i], self.values[i])
+        return (int(self.indices[i]), float(self.values[i]))
+
+    def __iter__(self):
+        return iter(self.pairs())
+
+    def __eq__(self, other):
+        if isinstance(other, Segments):
+            return (np.array_equal(self.indices, other.indices)
+                and np.array_equal(self.values, other.values))
+        return self.pairs() == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Segments(%r, %r)' % (self.indices, self.values)
+
+    def duplicate_mask(self):
+        '''
+        True for every segment with the same value as the one before it
+        '''
+        mask = np.zeros(len(self), dtype=bool)
+        mask[1:] = self.values[1:] == self.values[:-1]
+        return mask
+
+    def keep(self, mask):
+        '''
+        Drops, in place, the segments where mask is False
+        '''
+        self.indices = self.indices[mask]
+        self.values = self.values[mask]
+
+def values_of(segd):
+    '''
+    Values of a Segments or a list of (index, value) pairs as an array
+    '''
+    if isinstance(segd, Segments):
+        return segd.values
+    return np.array([v for i, v in segd], dtype=float)
+
+def indices_of(segd):
+    '''
+    Indices of a Segments or a list of (index, value) pairs as an array
+    '''
+    if isinstance(segd, Segments):
+        return segd.indices
+    return np.array([i for i, v in segd], dtype=np.int64)
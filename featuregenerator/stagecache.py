@@ -0,0 +1,132 @@
+'''Content addressed cache for pipeline stages
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Every pipeline stage (csv parse, segmentation, feature extraction, PCA,
+t-SNE) is stored under a key hashed from the key of its input and its
+own parameters, with the first stage keyed by a hash of the csv bytes.
+Changing a parameter therefore only invalidates that stage and the ones
+after it: a new window length reuses the cached segmentation, a new
+perplexity reuses the cached features and PCA.
+
+Entries are directories of .npy files, one per array, so they can be
+loaded memory-mapped. The cache is capped at max_bytes and evicts the
+least recently used entries once it grows past that.
+'''
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+def bytes_digest(data):
+    '''
+    sha1 of a string of bytes, e.g. the contents of a file read from stdin
+    '''
+    return hashlib.sha1(data).hexdigest()
+
+def stage_key(stage, *parts):
+    '''
+    Key of a stage from its name, the key of its input and its
+    parameters, which must be json serializable
+    '''
+    text = json.dumps([stage] + list(parts), sort_keys=True)
+    return hashlib.sha1(text).hexdigest()
+
+class StageCache(object):
+
+    def __init__(self, root, max_bytes=1 << 30):
+        self.root = root
+        self.max_bytes = max_bytes
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    def _path(self, stage, key):
+        return os.path.join(self.root, stage, key)
+
+    def get(self, stage, key, mmap_mode='r'):
+        '''
+        The arrays stored for key as a dict, memory-mapped unless
+        mmap_mode is None, or None when there is no such entry
+        '''
+        path = self._path(stage, key)
+        if not os.path.isdir(path):
+            return None
+
+        # mark the entry as recently used
+        os.utime(path, None)
+        arrays = {}
+        for name in os.listdir(path):
+            if name.endswith('.npy'):
+                arrays[name[:-4]] = np.load(os.path.join(path, name),
+                    mmap_mode=mmap_mode)
+        return arrays
+
+    def put(self, stage, key, arrays):
+        '''
+        Stores the dict of arrays for key, then evicts old entries
+        if the cache grew past max_bytes
+        '''
+        path = self._path(stage, key)
+        parent = os.path.dirname(path)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+
+        # write aside and rename so readers never see half an entry
+        tmp = tempfile.mkdtemp(dir=parent)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + '.npy'), np.asarray(array))
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # another process stored the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.evict()
+
+    def cached(self, stage, key, compute):
+        '''
+        The arrays for key, calling compute() for a dict of them
+        and storing it when they are not cached yet
+        '''
+        arrays = self.get(stage, key)
+        if arrays is None:
+            print('Computing stage ' + stage)
+            arrays = compute()
+            self.put(stage, key, arrays)
+        else:
+            print('Using cached stage ' + stage)
+        return arrays
+
+    def entries(self):
+        '''
+        List of (last use, bytes, path) for every entry
+        '''
+        found = []
+        for stage in os.listdir(self.root):
+            stagedir = os.path.join(self.root, stage)
+            if not os.path.isdir(stagedir):
+                continue
+            for key in os.listdir(stagedir):
+                path = os.path.join(stagedir, key)
+                if key.startswith('tmp'):
+                    # still being written by put
+                    continue
+                size = sum(os.path.getsize(os.path.join(path, name))
+                    for name in os.listdir(path))
+                found.append((os.path.getmtime(path), size, path))
+        return found
+
+    def evict(self):
+        '''
+        Removes least recently used entries until the cache
+        holds at most max_bytes
+        '''
+        found = sorted(self.entries())
+        total = sum(size for used, size, path in found)
+        for used, size, path in found:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -0,0 +1,231 @@
+#!/bin/python2
+'''Headless figure rendering script
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Renders the figures of compare_segmenting.py and visualize.py to files
+for many Yahoo Finance csv files and parameter sets at once, without a
+display, e.g. for the report/:
+
+    <symbol>-k<k>-comparison      original series against its sqr and
+                                  relative residual segmentations
+    <symbol>-k<k>-l<l>-embedding  2-D or 3-D t-SNE scatter of the
+                                  windows, coloured by cluster
+    <symbol>-k<k>-l<l>-clusters   a row of sample windows for every
+                                  k-means cluster of the embedding
+
+Every (symbol, k, l) combination is one job on a process pool. Figures
+are drawn with the Agg canvas straight onto matplotlib.figure.Figure
+objects, never through pyplot, and every worker keeps one figure of
+each kind that it clears and redraws for the next job instead of
+creating a new one.
+'''
+import os
+import glob
+import itertools
+import multiprocessing as mp
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from scipy.cluster.vq import kmeans2
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from mpl_toolkits.mplot3d import Axes3D
+from featuregenerator import preprocess as pp
+from tsne import bhtsne
+import compare_segmenting
+
+FORMATS = ['png', 'pdf']
+
+# figures of this worker by kind, reused between jobs
+_figures = {}
+
+def reused_figure(kind, size):
+    '''
+    The figure of this process for kind, cleared
+    '''
+    fig = _figures.get(kind)
+    if fig is None:
+        fig = Figure(figsize=size)
+        FigureCanvasAgg(fig)
+        _figures[kind] = fig
+    else:
+        fig.clf()
+        fig.set_size_inches(size)
+    return fig
+
+def save(fig, outdir, name, formats):
+    paths = [os.path.join(outdir, name + '.' + fmt) for fmt in formats]
+    for path in paths:
+        fig.savefig(path)
+    return paths
+
+def draw_embedding(fig, result, labels, k, l):
+    '''
+    Scatter of the 2-D or 3-D embedding coloured by cluster label
+    '''
+    if result.shape[1] == 3:
+        ax = fig.add_subplot(111, projection='3d')
+        ax.scatter(result[:, 0], result[:, 1], result[:, 2], c=labels,
+            cmap='tab10', s=4, depthshade=False)
+    else:
+        ax = fig.add_subplot(111)
+        ax.scatter(result[:, 0], result[:, 1], c=labels, cmap='tab10', s=4)
+    ax.set_title('segment length: {}, window length:{}'.format(k, l))
+
+def draw_clusters(fig, segd, data, labels, l, samples, rng):
+    '''
+    A row per cluster of up to samples windows picked at random from
+    it, each the segmented window over the original series
+    '''
+    clusters = np.unique(labels)
+    for row, c in enumerate(clusters):
+        members = np.flatnonzero(labels == c)
+        picked = np.sort(rng.choice(members, min(samples, len(members)),
+            replace=False))
+        for col, ind in enumerate(picked):
+            ax = fig.add_subplot(len(clusters), samples, row*samples + col + 1)
+            seg = segd[ind:ind + l]
+            ax.plot(seg.indices, seg.values, 'r-')
+            ax.plot(np.arange(seg.indices[0], seg.indices[-1] + 1),
+                data[seg.indices[0]:seg.indices[-1] + 1], 'k:')
+            ax.set_xticks([])
+            ax.set_yticks([])
+            if col == 0:
+                ax.set_ylabel('cluster %d (%d)' % (c, len(members)))
+
+def render_job(args):
+    '''
+    Renders every figure of one (csv file, k, l) combination, returns
+    the paths written
+    '''
+    (csvpath, k, l, use_relative_err, max_error, column, outdir, formats,
+        dims, clusters, samples, perplexity, max_iter, comparison) = args
+    name = '%s-k%d' % (pp.symbol_name(csvpath), k)
+    paths = []
+
+    features, segd, dates, data = pp.gen_simple_features(csvpath, k, l,
+        use_relative_err, max_error, column)
+    data = np.asarray(data)
+
+    if comparison:
+        segd1, segd2 = compare_segmenting.segment_both(data.tolist(), k)
+        fig = reused_figure('comparison', (8, 10))
+        compare_segmenting.draw(fig, dates, data, segd1, segd2)
+        paths.extend(save(fig, outdir, name + '-comparison', formats))
+
+    result = bhtsne.calc_tsne(np.asarray(features), NO_DIMS=dims,
+        PERPLEX=perplexity, MAX_ITER=max_iter, SEED=0)
+    # kmeans2 draws from the global generator, seed it so reruns
+    # give the same clusters
+    np.random.seed(0)
+    centroids, labels = kmeans2(result, clusters, minit='points')
+
+    name = '%s-l%d' % (name, l)
+    fig = reused_figure('embedding', (8, 8))
+    draw_embedding(fig, result, labels, k, l)
+    paths.extend(save(fig, outdir, name + '-embedding', formats))
+
+    fig = reused_figure('clusters', (2*samples, 1.5*clusters))
+    draw_clusters(fig, segd, data, labels, l, samples,
+        np.random.RandomState(0))
+    paths.extend(save(fig, outdir, name + '-clusters', formats))
+
+    return paths
+
+def run(csvpaths, ks, ls, outdir, use_relative_err=False,
+        max_error=float('inf'), column='Close', formats=('png',), dims=2,
+        clusters=6, samples=5, processes=None, perplexity=30, max_iter=1000):
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    # the comparison only depends on k, render it with the first l
+    jobs = [(p, k, l, use_relative_err, max_error, column, outdir,
+        list(formats), dims, clusters, samples, perplexity, max_iter,
+        l == ls[0]) for p, k, l in itertools.product(csvpaths, ks, ls)]
+    print("Rendering " + str(len(jobs)) + " parameter sets")
+
+    pool = mp.Pool(processes)
+    try:
+        paths = pool.map(render_job, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    paths = [p for job in paths for p in job]
+    print("Wrote " + str(len(paths)) + " files to " + outdir)
+    return paths
+
+if __name__ == '__main__':
+    import argparse
+
+    aparser = argparse.ArgumentParser(description=
+                '''Render segmentation and embedding figures of many Yahoo
+                Finance csv files to image files without a display''')
+    aparser.add_argument(dest='csvFiles',
+        nargs='*',
+        help='Paths to .csv files, every .csv file in data/ if not specified')
+    aparser.add_argument('-k', dest='segmentLengths',
+        type=int,
+        nargs='+',
+        required=True,
+        help='ALG. PARAM: Average lengths of segment')
+    aparser.add_argument('-l', dest='windowLengths',
+        type=int,
+        nargs='+',
+        required=True,
+        help='ALG. PARAM: Lengths of sliding window')
+    aparser.add_argument('-r', dest='relativeError',
+        action='store_true',
+        default=False,
+        help='Use relative square residual error during SEGMENTATION')
+    aparser.add_argument('-e', dest='maxerror',
+        type=float,
+        default=float('inf'),
+        help='Maximum allowed square residual during SEGMENTATION process')
+    aparser.add_argument('-a', dest='column',
+        action='store_const',
+        const='Adj Close',
+        default='Close',
+        help='Use adjusted close prices instead of close prices')
+    aparser.add_argument('-o', dest='outDir',
+        type=str,
+        required=True,
+        help='Directory to write the figures to')
+    aparser.add_argument('-f', dest='formats',
+        choices=FORMATS,
+        nargs='+',
+        default=['png'],
+        help='File formats to write every figure in')
+    aparser.add_argument('-d', dest='dims',
+        type=int,
+        choices=[2, 3],
+        default=2,
+        help='Dimensions of the t-SNE embedding')
+    aparser.add_argument('-n', dest='clusters',
+        type=int,
+        default=6,
+        help='Number of k-means clusters of the embedding')
+    aparser.add_argument('-s', dest='samples',
+        type=int,
+        default=5,
+        help='Sample windows shown per cluster')
+    aparser.add_argument('-j', dest='processes',
+        type=int,
+        default=None,
+        help='Number of worker processes, defaults to the number of CPUs')
+    aparser.add_argument('-p', dest='perplexity',
+        type=float,
+        default=30,
+        help='t-SNE perplexity')
+    aparser.add_argument('-i', dest='iterations',
+        type=int,
+        default=1000,
+        help='t-SNE iterations')
+
+    args = aparser.parse_args()
+
+    csvpaths = args.csvFiles or sorted(glob.glob(os.path.join(pp.DATA_DIR, '*.csv')))
+    run(csvpaths, args.segmentLengths, args.windowLengths, args.outDir,
+        args.relativeError, args.maxerror, args.column, args.formats,
+        args.dims, args.clusters, args.samples, args.processes,
+        args.perplexity, args.iterations)
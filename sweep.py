@@ -0,0 +1,188 @@
+#!/bin/python2
+'''Parameter sweep script
+Author: JumboSliceKimboShrimp && Riceballicious
+
+Runs the preprocessing pipeline over every combination of segment
+length k, window length l, segmenting error function and max error for
+a set of Yahoo Finance csv files, spread over a process pool.
+
+Stages only depend on their own parameters, so each csv is parsed once,
+each (k, error, max error) segmentation is computed once and shared by
+all window lengths, and so on. Results are written as
+
+    OUTDIR/<symbol>/series.npz
+    OUTDIR/<symbol>/k<k>-<error>-e<max error>/segments.npz
+    OUTDIR/<symbol>/k<k>-<error>-e<max error>/l<l>/features.npy
+    OUTDIR/<symbol>/k<k>-<error>-e<max error>/l<l>/embedding.npy
+    OUTDIR/sweep.json
+
+where sweep.json lists every configuration with its output directory
+and the seconds spent in each (possibly shared) stage.
+'''
+import os
+import json
+import time
+import itertools
+import multiprocessing as mp
+import numpy as np
+from featuregenerator import preprocess as pp
+from featuregenerator import featextract as fex
+from featuregenerator.segments import Segments
+from tsne import bhtsne
+
+ERRORS = ['sqr', 'relative']
+
+def symbol_dir(outdir, csvpath):
+    return os.path.join(outdir, pp.symbol_name(csvpath))
+
+def segment_dir(symdir, k, error, max_error):
+    return os.path.join(symdir, 'k%d-%s-e%g' % (k, error, max_error))
+
+def makedirs(path):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+def parse_stage(args):
+    csvpath, symdir = args
+    start = time.time()
+    with open(csvpath, 'rb') as csvfile:
+        dates, data = pp.csv_import(csvfile)
+    makedirs(symdir)
+    np.savez(os.path.join(symdir, 'series.npz'),
+        dates=np.array(dates), data=np.array(data))
+    return time.time() - start
+
+def segment_stage(args):
+    symdir, k, error, max_error = args
+    start = time.time()
+    data = np.load(os.path.join(symdir, 'series.npz'))['data'].tolist()
+    segd = pp.segment(data, k, error == 'relative', max_error)
+    segdir = segment_dir(symdir, k, error, max_error)
+    makedirs(segdir)
+    np.savez(os.path.join(segdir, 'segments.npz'),
+        indices=segd.indices, values=segd.values)
+    return time.time() - start
+
+def feature_stage(args):
+    segdir, l, embed, perplexity, max_iter = args
+    timings = {}
+
+    start = time.time()
+    segs = np.load(os.path.join(segdir, 'segments.npz'))
+    segd = Segments(segs['indices'], segs['values'])
+    features = np.asarray(fex.extract_features(segd, l))
+    featdir = os.path.join(segdir, 'l%d' % l)
+    makedirs(featdir)
+    np.save(os.path.join(featdir, 'features.npy'), features)
+    timings['features'] = time.time() - start
+
+    if embed:
+        start = time.time()
+        result = bhtsne.calc_tsne(features, PERPLEX=perplexity,
+            MAX_ITER=max_iter)
+        np.save(os.path.join(featdir, 'embedding.npy'), result)
+        timings['embedding'] = time.time() - start
+
+    return timings
+
+def run(csvpaths, ks, ls, errors, max_errors, outdir,
+        processes=None, embed=True, perplexity=30, max_iter=1000):
+    # every symbol gets a directory of its own
+    symdirs = [symbol_dir(outdir, p) for p in csvpaths]
+    for i, symdir in enumerate(symdirs):
+        if symdir in symdirs[:i]:
+            raise Exception(('Duplicate symbol ', os.path.basename(symdir),
+                ' in ', csvpaths[symdirs.index(symdir)], ' and ', csvpaths[i]))
+
+    pool = mp.Pool(processes)
+    try:
+        # every stage fans out over the unique parameters it depends on
+        parse_times = pool.map(parse_stage, zip(csvpaths, symdirs))
+
+        seg_keys = list(itertools.product(symdirs, ks, errors, max_errors))
+        seg_times = pool.map(segment_stage, seg_keys)
+
+        feat_keys = [(segment_dir(*key), l, embed, perplexity, max_iter)
+            for key in seg_keys for l in ls]
+        feat_times = pool.map(feature_stage, feat_keys)
+    finally:
+        pool.close()
+        pool.join()
+
+    parse_times = dict(zip(symdirs, parse_times))
+    seg_times = dict(zip(seg_keys, seg_times))
+
+    configs = []
+    feat_times = iter(feat_times)
+    for key in seg_keys:
+        symdir, k, error, max_error = key
+        for l in ls:
+            timings = next(feat_times)
+            timings['parse'] = parse_times[symdir]
+            timings['segment'] = seg_times[key]
+            featdir = os.path.join(segment_dir(*key), 'l%d' % l)
+            configs.append({
+                'symbol': os.path.basename(symdir),
+                'k': k, 'l': l, 'error': error, 'max_error': max_error,
+                'path': os.path.relpath(featdir, outdir),
+                'seconds': timings})
+
+    with open(os.path.join(outdir, 'sweep.json'), 'w') as out:
+        json.dump({'configurations': configs}, out, indent=2, sort_keys=True)
+
+    return configs
+
+if __name__ == '__main__':
+    import argparse
+
+    aparser = argparse.ArgumentParser(description=
+                'Sweep preprocessing parameters over Yahoo Finance csv files')
+    aparser.add_argument(dest='csvFiles',
+        nargs='+',
+        help='Paths to .csv files')
+    aparser.add_argument('-k', dest='segmentLengths',
+        type=int,
+        nargs='+',
+        required=True,
+        help='ALG. PARAM: Average lengths of segment to try')
+    aparser.add_argument('-l', dest='windowLengths',
+        type=int,
+        nargs='+',
+        required=True,
+        help='ALG. PARAM: Lengths of sliding window to try')
+    aparser.add_argument('-r', dest='errors',
+        nargs='+',
+        choices=ERRORS,
+        default=['sqr'],
+        help='ALG. PARAM: Segmenting residuals to try')
+    aparser.add_argument('-e', dest='maxerrors',
+        type=float,
+        nargs='+',
+        default=[float('inf')],
+        help='Maximum allowed square residuals during SEGMENTATION to try')
+    aparser.add_argument('-o', dest='outDir',
+        type=str,
+        required=True,
+        help='Directory to write results to')
+    aparser.add_argument('-j', dest='processes',
+        type=int,
+        default=None,
+        help='Number of worker processes, defaults to the number of CPUs')
+    aparser.add_argument('-n', dest='skipEmbedding',
+        action='store_true',
+        default=False,
+        help='Stop after feature extraction, skipping t-SNE')
+    aparser.add_argument('-p', dest='perplexity',
+        type=float,
+        default=30,
+        help='t-SNE perplexity')
+    aparser.add_argument('-i', dest='iterations',
+        type=int,
+        default=1000,
+        help='t-SNE iterations')
+
+    args = aparser.parse_args()
+
+    run(args.csvFiles, args.segmentLengths, args.windowLengths,
+        args.errors, args.maxerrors, args.outDir, args.processes,
+        not args.skipEmbedding, args.perplexity, args.iterations)
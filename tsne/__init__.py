@@ -1 +1 @@
-__all__ = ['calc_tsne']
+__all__ = ['calc_tsne', 'bhtsne', 'vptree', 'reference']
@@ -0,0 +1,274 @@
+"""
+In-process Barnes-Hut t-SNE
+
+Embeds the rows of a matrix with t-SNE without writing data.dat
+or calling out to the tSNE_* binaries. Follows the Barnes-Hut
+variant of van der Maaten (2014): input similarities are only
+computed over the 3*PERPLEX nearest neighbours of each point,
+found with a vantage-point tree, and the repulsive forces of
+the gradient are approximated with a space-partitioning tree,
+for O(n log n) work per iteration instead of O(n^2).
+
+The space-partitioning tree is built from sorted Morton codes
+and walked for all points at once, one tree level at a time,
+so every iteration is a fixed number of NumPy operations per
+level rather than a python loop over points.
+
+HOW TO USE
+Just call the method calc_tsne(dataMatrix)
+"""
+
+import numpy as np
+from scipy import sparse
+from calc_tsne import PCA
+from vptree import VPTree
+from featuregenerator import instrument
+
+@instrument.timed('bhtsne.calc_tsne')
+def calc_tsne(dataMatrix, NO_DIMS=2, PERPLEX=30, INITIAL_DIMS=30,
+        THETA=0.5, MAX_ITER=1000, SEED=None, PCA_METHOD='eigh'):
+    """
+    This is the main function.
+    dataMatrix is a 2D numpy array containing your data (each row is a data point)
+    Returns the NO_DIMS dimensional embedding, one row per data point
+    in the same order as the input.
+    THETA trades accuracy of the repulsive forces for speed, 0 is exact.
+    PCA_METHOD is passed on to calc_tsne.PCA as its METHOD.
+    """
+    if PCA_METHOD != 'incremental':
+        dataMatrix = np.asarray(dataMatrix, dtype=float)
+    X = PCA(dataMatrix, INITIAL_DIMS, PCA_METHOD)
+    return embed(X, NO_DIMS, PERPLEX, THETA, MAX_ITER, SEED)
+
+@instrument.timed()
+def embed(X, NO_DIMS=2, PERPLEX=30, THETA=0.5, MAX_ITER=1000, SEED=None):
+    """
+    t-SNE of the rows of X as they are, without the PCA step
+    """
+    X = np.asarray(X, dtype=float)
+    X = X - X.mean(axis=0)
+    X /= max(np.abs(X).max(), 1e-300)
+
+    n = len(X)
+    K = int(3*PERPLEX)
+    if n - 1 < K:
+        raise Exception(('Perplexity=', PERPLEX, ' too large for ', n, ' data points'))
+
+    print 'Finding %i nearest neighbours with a vantage-point tree' % K
+    with instrument.span('nearest neighbours'):
+        dist, ind = VPTree(X).knn(K)
+
+    print 'Computing input similarities'
+    with instrument.span('input similarities'):
+        P = _joint_probabilities(dist**2, ind, PERPLEX)
+
+    print 'Learning embedding'
+    with instrument.span('gradient descent'):
+        Y = _gradient_descent(P, n, NO_DIMS, THETA, MAX_ITER,
+            np.random.RandomState(SEED))
+    instrument.count('gradient descent iterations', MAX_ITER)
+    return Y
+
+def _conditional_probabilities(D, perplexity, tol=1e-5, max_iter=200):
+    """
+    Row-wise gaussian kernels over the squared distances D (n x K)
+    with the precision of every row binary searched to give the
+    requested perplexity, all rows at once
+    """
+    n = len(D)
+    # the kernel is normalised, so shifting each row to start at
+    # zero changes nothing but keeps exp from underflowing
+    D = D - D.min(axis=1)[:, None]
+    target = np.log(perplexity)
+
+    beta = np.ones(n)
+    beta_min = np.zeros(n)
+    beta_max = np.full(n, np.inf)
+    for it in xrange(max_iter):
+        P = np.exp(-D * beta[:, None])
+        sumP = P.sum(axis=1)
+        H = np.log(sumP) + beta * (D * P).sum(axis=1) / sumP
+
+        diff = H - target
+        todo = np.abs(diff) >= tol
+        if not todo.any():
+            break
+
+        # entropy too high means the kernel is too wide
+        wide = todo & (diff > 0)
+        narrow = todo & (diff <= 0)
+        beta_min[wide] = beta[wide]
+        beta_max[narrow] = beta[narrow]
+        beta[wide] = np.where(np.isinf(beta_max[wide]),
+            beta[wide] * 2, (beta[wide] + beta_max[wide]) / 2)
+        beta[narrow] = (beta[narrow] + beta_min[narrow]) / 2
+
+    return P / sumP[:, None]
+
+def _joint_probabilities(D, ind, perplexity):
+    """
+    Symmetrised, normalised sparse input similarities
+    """
+    n, K = ind.shape
+    P = _conditional_probabilities(D, perplexity)
+    rows = np.repeat(np.arange(n), K)
+    P = sparse.csr_matrix((P.ravel(), (rows, ind.ravel())), shape=(n, n))
+    P = P + P.T
+    P /= P.sum()
+    return P.tocoo()
+
+def _attractive_forces(P, Y):
+    # sum over neighbours j of p_ij q_ij Z (y_i - y_j)
+    diff = Y[P.row] - Y[P.col]
+    w = P.data / (1 + (diff**2).sum(axis=1))
+    n, dims = Y.shape
+    F = np.empty((n, dims))
+    for j in xrange(dims):
+        F[:, j] = np.bincount(P.row, w * diff[:, j], minlength=n)
+    return F
+
+def _build_tree(Y, bits):
+    """
+    Levels of a 2^dims-ary space-partitioning tree over the rows of Y.
+
+    Points are sorted by Morton code so the cells of every level are
+    contiguous runs of the sorted codes. Each level is a tuple of
+    (cell point counts, cell coordinate sums, cell of every point,
+    first child cell, one past the last child cell).
+    """
+    n, dims = Y.shape
+    lo = Y.min(axis=0)
+    width = (Y.max(axis=0) - lo).max()
+    if width <= 0:
+        width = 1.0
+
+    cells = 1 << bits
+    grid = np.minimum(((Y - lo) / width * cells).astype(np.int64), cells - 1)
+    code = np.zeros(n, dtype=np.int64)
+    for b in xrange(bits):
+        for j in xrange(dims):
+            code |= ((grid[:, j] >> b) & 1) << (b*dims + j)
+
+    order = np.argsort(code, kind='mergesort')
+    code = code[order]
+    Ysorted = Y[order]
+
+    prefixes = []
+    levels = []
+    for d in xrange(bits + 1):
+        prefix = code >> (dims*(bits - d))
+        starts = np.flatnonzero(np.r_[True, prefix[1:] != prefix[:-1]])
+        counts = np.diff(np.r_[starts, n])
+        sums = np.add.reduceat(Ysorted, starts, axis=0)
+        point_cell = np.empty(n, dtype=np.int64)
+        point_cell[order] = np.repeat(np.arange(len(starts)), counts)
+
+        prefixes.append(prefix[starts])
+        levels.append([counts, sums, point_cell, None, None])
+        if counts.max() == 1:
+            break
+
+    for d in xrange(len(levels) - 1):
+        child = prefixes[d+1] >> dims
+        levels[d][3] = np.searchsorted(child, prefixes[d], 'left')
+        levels[d][4] = np.searchsorted(child, prefixes[d], 'right')
+
+    return levels, width
+
+def _repulsive_forces(Y, theta, bits):
+    """
+    Barnes-Hut estimate of sum over j of q_ij^2 Z^2 (y_i - y_j)
+    and of the normalisation Z = sum over i != j of (1 + |y_i - y_j|^2)^-1
+    """
+    n, dims = Y.shape
+    levels, width = _build_tree(Y, bits)
+
+    F = np.zeros((n, dims))
+    sumQ = np.zeros(n)
+
+    # (point, cell) pairs still to be resolved at the current level
+    pt = np.arange(n)
+    cell = np.zeros(n, dtype=np.int64)
+    for d, (counts, sums, point_cell, cstart, cend) in enumerate(levels):
+        if len(pt) == 0:
+            break
+        last = d == len(levels) - 1
+        half_width = width / 2.0**(d + 1)
+
+        # a point never interacts with itself
+        own = point_cell[pt] == cell
+        count = counts[cell] - own
+        com = (sums[cell] - own[:, None] * Y[pt]) / np.maximum(count, 1)[:, None]
+        diff = Y[pt] - com
+        d2 = (diff**2).sum(axis=1)
+
+        # summarise a cell by its centre of mass when it is far enough
+        # away, cells holding the point itself are always opened up
+        leaf = (counts[cell] == 1) | last
+        accept = leaf | (~own & (half_width**2 < theta**2 * d2))
+
+        use = accept & (count > 0)
+        q = 1.0 / (1 + d2[use])
+        w = count[use] * q
+        p = pt[use]
+        sumQ += np.bincount(p, w, minlength=n)
+        wq = w * q
+        for j in xrange(dims):
+            F[:, j] += np.bincount(p, wq * diff[use, j], minlength=n)
+
+        if last:
+            break
+
+        # replace every rejected pair by its children
+        opened = ~accept
+        pt = pt[opened]
+        first = cstart[cell[opened]]
+        nchild = cend[cell[opened]] - first
+        total = nchild.sum()
+        offsets = np.arange(total) - np.repeat(np.cumsum(nchild) - nchild, nchild)
+        pt = np.repeat(pt, nchild)
+        cell = np.repeat(first, nchild) + offsets
+
+    return F, sumQ.sum()
+
+def _gradient_descent(P, n, NO_DIMS, theta, max_iter, rng,
+        eta=200.0, exaggeration=12.0, stop_lying_iter=250,
+        mom_switch_iter=250):
+    bits = min(20, 62 // NO_DIMS)
+
+    Y = rng.randn(n, NO_DIMS) * 1e-4
+    uY = np.zeros((n, NO_DIMS))
+    gains = np.ones((n, NO_DIMS))
+    momentum = 0.5
+
+    P = P.copy()
+    P.data *= exaggeration
+
+    for it in xrange(max_iter):
+        Fattr = _attractive_forces(P, Y)
+        Frep, Z = _repulsive_forces(Y, theta, bits)
+        dY = Fattr - Frep / Z
+
+        same = (dY > 0) == (uY > 0)
+        gains = np.where(same, gains * 0.8, gains + 0.2)
+        np.maximum(gains, 0.01, out=gains)
+        uY = momentum * uY - eta * gains * dY
+        Y += uY
+        Y -= Y.mean(axis=0)
+
+        if it == stop_lying_iter:
+            P.data /= exaggeration
+        if it == mom_switch_iter:
+            momentum = 0.8
+
+        if it % 50 == 0 or it == max_iter - 1:
+            print 'Iteration %i: error is %f' % (it, _kl_divergence(P, Y, Z))
+
+    return Y
+
+def _kl_divergence(P, Y, Z):
+    # KL(P||Q) over the non-zero entries of P, with Z the
+    # (approximate) normalisation of Q
+    d2 = ((Y[P.row] - Y[P.col])**2).sum(axis=1)
+    Q = 1.0 / (1 + d2) / Z
+    return (P.data * np.log(np.maximum(P.data, 1e-300) / np.maximum(Q, 1e-300))).sum()
@@ -15,43 +15,160 @@ October 24th 2008
 from struct import *
 import sys
 import os
+import shutil
+import tempfile
+import subprocess
 from numpy import *
+from featuregenerator import instrument
 
-def calc_tsne(dataMatrix, folderPrefix = '', NO_DIMS=2,PERPLEX=30,INITIAL_DIMS=30,LANDMARKS=1):
+@instrument.timed()
+def calc_tsne(dataMatrix, folderPrefix = '', NO_DIMS=2,PERPLEX=30,INITIAL_DIMS=30,LANDMARKS=1,PCA_METHOD='eigh'):
     """
     This is the main function.
     dataMatrix is a 2D numpy array containing your data (each row is a data point)
     Remark : LANDMARKS is a ratio (0<LANDMARKS<=1)
     If LANDMARKS == 1 , it returns the list of points in the same order as the input
+    Every call works in its own temporary directory, so several can run at once
+    PCA_METHOD is passed on to PCA as its METHOD
     """
     
-    dataMatrix=PCA(dataMatrix,INITIAL_DIMS)
-    writeDat(dataMatrix,folderPrefix,NO_DIMS,PERPLEX,LANDMARKS)
-    tSNE(folderPrefix)
-    Xmat,LM,costs=readResult(folderPrefix)
-    clearData()
+    dataMatrix=PCA(dataMatrix,INITIAL_DIMS,PCA_METHOD)
+    workDir=tempfile.mkdtemp(prefix='tsne-')
+    try:
+        writeDat(dataMatrix,folderPrefix,NO_DIMS,PERPLEX,LANDMARKS,workDir)
+        tSNE(folderPrefix,workDir)
+        Xmat,LM,costs=readResult(folderPrefix,workDir)
+    finally:
+        clearData(workDir)
     if LANDMARKS==1:
         X=reOrder(Xmat,LM)
         return X
     return Xmat,LM
 
-def PCA(dataMatrix, INITIAL_DIMS) :
+@instrument.timed()
+def PCA(dataMatrix, INITIAL_DIMS, METHOD='eigh') :
     """
     Performs PCA on data.
     Reduces the dimensionality to INITIAL_DIMS
+    METHOD picks how the principal axes are found :
+      'eigh'        eigendecomposition of the covariance matrix
+      'randomized'  randomized SVD, for tall and wide matrices
+      'incremental' covariance accumulated over row batches, dataMatrix
+                    can be a np.memmap bigger than RAM
     """
     print 'Performing PCA'
 
-    dataMatrix= dataMatrix-dataMatrix.mean(axis=0)
+    if dataMatrix.shape[1]<INITIAL_DIMS:
+        INITIAL_DIMS=dataMatrix.shape[1]
 
+    if METHOD == 'eigh' :
+        return eighPCA(dataMatrix,INITIAL_DIMS)
+    elif METHOD == 'randomized' :
+        return randomizedPCA(dataMatrix,INITIAL_DIMS)
+    elif METHOD == 'incremental' :
+        return incrementalPCA(dataMatrix,INITIAL_DIMS)
+    raise Exception(('Unknown PCA method=',METHOD))
+
+def PCAAxes(dataMatrix, INITIAL_DIMS, METHOD='eigh') :
+    """
+    Mean and principal axes (one per column) that PCA projects onto,
+    so other rows can later be projected onto the same basis with
+    projectPCA. METHOD is as in PCA
+    """
     if dataMatrix.shape[1]<INITIAL_DIMS:
         INITIAL_DIMS=dataMatrix.shape[1]
 
-    (eigValues,eigVectors)=linalg.eig(cov(dataMatrix.T))
-    perm=argsort(-eigValues)
-    eigVectors=eigVectors[:,perm[0:INITIAL_DIMS]]
-    dataMatrix=dot(dataMatrix,eigVectors)
-    return dataMatrix
+    if METHOD == 'eigh' :
+        return eighAxes(dataMatrix,INITIAL_DIMS)
+    elif METHOD == 'randomized' :
+        return randomizedAxes(dataMatrix,INITIAL_DIMS)
+    elif METHOD == 'incremental' :
+        return incrementalAxes(dataMatrix,INITIAL_DIMS)
+    raise Exception(('Unknown PCA method=',METHOD))
+
+def projectPCA(dataMatrix, mean, axes, BATCH_ROWS=65536) :
+    """
+    Rows of dataMatrix projected onto the axes found by PCAAxes,
+    BATCH_ROWS rows at a time
+    """
+    n = dataMatrix.shape[0]
+    result=empty((n,axes.shape[1]))
+    for start in range(0,n,BATCH_ROWS) :
+        batch=asarray(dataMatrix[start:start+BATCH_ROWS],dtype=float64)
+        result[start:start+len(batch)]=dot(batch-mean,axes)
+    return result
+
+def eighPCA(dataMatrix, INITIAL_DIMS) :
+    """
+    PCA through the symmetric eigensolver, the covariance matrix
+    always has real eigenvalues so there is no need for linalg.eig
+    """
+    mean,eigVectors=eighAxes(dataMatrix,INITIAL_DIMS)
+    return dot(dataMatrix-mean,eigVectors)
+
+def eighAxes(dataMatrix, INITIAL_DIMS) :
+    mean=dataMatrix.mean(axis=0)
+    dataMatrix= dataMatrix-mean
+
+    # eigh returns eigenvalues in ascending order
+    (eigValues,eigVectors)=linalg.eigh(cov(dataMatrix.T))
+    eigVectors=eigVectors[:,::-1][:,0:INITIAL_DIMS]
+    return mean,eigVectors
+
+def randomizedPCA(dataMatrix, INITIAL_DIMS, OVERSAMPLE=10, POWER_ITERS=4, SEED=0) :
+    """
+    PCA through a randomized truncated SVD (Halko, Martinsson and
+    Tropp 2011) of the centred data. Costs O(n d INITIAL_DIMS)
+    instead of the O(n d^2 + d^3) of the full covariance route
+    """
+    mean,axes=randomizedAxes(dataMatrix,INITIAL_DIMS,OVERSAMPLE,POWER_ITERS,SEED)
+    return dot(dataMatrix-mean,axes)
+
+def randomizedAxes(dataMatrix, INITIAL_DIMS, OVERSAMPLE=10, POWER_ITERS=4, SEED=0) :
+    mean=dataMatrix.mean(axis=0)
+    dataMatrix= dataMatrix-mean
+    n,d = dataMatrix.shape
+    rank=min(INITIAL_DIMS+OVERSAMPLE,n,d)
+
+    # orthonormal basis for the range of dataMatrix, sharpened by a
+    # few power iterations so small singular values fall away
+    rng=random.RandomState(SEED)
+    Q,R=linalg.qr(dot(dataMatrix,rng.randn(d,rank)))
+    for i in range(POWER_ITERS) :
+        Q,R=linalg.qr(dot(dataMatrix.T,Q))
+        Q,R=linalg.qr(dot(dataMatrix,Q))
+
+    U,S,Vt=linalg.svd(dot(Q.T,dataMatrix),full_matrices=False)
+    return mean,Vt[0:INITIAL_DIMS].T
+
+def incrementalPCA(dataMatrix, INITIAL_DIMS, BATCH_ROWS=65536) :
+    """
+    PCA that only ever holds BATCH_ROWS rows of dataMatrix in memory.
+    The first pass accumulates the mean and covariance batch by batch
+    (pairwise update, so it stays accurate over many batches), the
+    second projects each batch onto the principal axes
+    """
+    mean,eigVectors=incrementalAxes(dataMatrix,INITIAL_DIMS,BATCH_ROWS)
+    return projectPCA(dataMatrix,mean,eigVectors,BATCH_ROWS)
+
+def incrementalAxes(dataMatrix, INITIAL_DIMS, BATCH_ROWS=65536) :
+    n,d = dataMatrix.shape
+    count=0
+    mean=zeros(d)
+    scatter=zeros((d,d))
+    for start in range(0,n,BATCH_ROWS) :
+        batch=asarray(dataMatrix[start:start+BATCH_ROWS],dtype=float64)
+        m=len(batch)
+        batchMean=batch.mean(axis=0)
+        centred=batch-batchMean
+        delta=batchMean-mean
+        scatter+=dot(centred.T,centred)+outer(delta,delta)*count*m/float(count+m)
+        mean+=delta*m/float(count+m)
+        count+=m
+
+    (eigValues,eigVectors)=linalg.eigh(scatter/(n-1))
+    eigVectors=eigVectors[:,::-1][:,0:INITIAL_DIMS]
+    return mean,eigVectors
 
 def readbin(type,file) :
     """
@@ -59,28 +176,32 @@ def readbin(type,file) :
     """
     return unpack(type,file.read(calcsize(type)))
 
-def writeDat(dataMatrix,prefix,NO_DIMS,PERPLEX,LANDMARKS):
+@instrument.timed()
+def writeDat(dataMatrix,prefix,NO_DIMS,PERPLEX,LANDMARKS,workDir='.'):
     """
-    Generates data.dat
+    Generates data.dat in workDir
     """
     print 'Writing data.dat'
     print 'Dimension of projection : %i \nPerplexity : %i \nLandmarks(ratio) : %f'%(NO_DIMS,PERPLEX,LANDMARKS)
     n,d = dataMatrix.shape
-    f = open('data.dat', 'wb')
-    f.write(pack('=iiid',n,d,NO_DIMS,PERPLEX))
-    f.write(pack('=d',LANDMARKS))
-    for inst in dataMatrix :
-        for el in inst :
-            f.write(pack('=d',el))
+    f = open(os.path.join(workDir,'data.dat'), 'wb')
+    f.write(pack('=iiidd',n,d,NO_DIMS,PERPLEX,LANDMARKS))
+    # the binary expects native doubles in row major order
+    ascontiguousarray(dataMatrix,dtype=float64).tofile(f)
+    instrument.count('data.dat bytes written', f.tell())
     f.close()
 
-def tSNE(prefix):
+@instrument.timed()
+def tSNE(prefix,workDir='.'):
     """
-    Calls the tsne c++ implementation depending on the platform
+    Calls the tsne c++ implementation depending on the platform,
+    it reads data.dat from and writes result.dat to workDir
     """
     platform=sys.platform
     if prefix == '':
         prefix = './'
+    # the executable runs inside workDir, so find it from here
+    prefix=os.path.abspath(prefix)+os.sep
     print'Platform detected : %s'%platform
     if platform in ['mac', 'darwin'] :
         cmd=prefix+'tSNE_maci'
@@ -92,22 +213,21 @@ def tSNE(prefix):
         print 'Not sure about the platform, we will try linux version...'
         cmd=prefix+'tSNE_linux'
     print 'Calling executable "%s"'%cmd
-    os.system(cmd)
+    subprocess.call([cmd],cwd=workDir)
     
 
-def readResult(prefix):
+@instrument.timed()
+def readResult(prefix,workDir='.'):
     """
-    Reads result from result.dat
+    Reads result from result.dat in workDir
     """
     print 'Reading result.dat'
-    f=open('result.dat','rb')
+    f=open(os.path.join(workDir,'result.dat'),'rb')
     n,ND=readbin('ii',f)
-    Xmat=empty((n,ND))
-    for i in range(n):
-        for j in range(ND):
-            Xmat[i,j]=readbin('d',f)[0]
-    LM=readbin('%ii'%n,f)
-    costs=readbin('%id'%n,f)
+    Xmat=fromfile(f,dtype=float64,count=n*ND).reshape((n,ND))
+    LM=fromfile(f,dtype=int32,count=n)
+    costs=fromfile(f,dtype=float64,count=n)
+    instrument.count('result.dat bytes read', f.tell())
     f.close()
     return (Xmat,LM,costs)
 
@@ -118,14 +238,12 @@ def reOrder(Xmat, LM):
     """
     print 'Reordering results'
     X=zeros(Xmat.shape)
-    for i,lm in enumerate(LM):
-        X[lm]=Xmat[i]
+    X[LM]=Xmat
     return X
 
-def clearData():
+def clearData(workDir):
     """
-    Clears files data.dat and result.dat
+    Removes workDir along with data.dat and result.dat
     """
     print 'Clearing data.dat and result.dat'
-    os.system('rm data.dat')
-    os.system('rm result.dat')
+    shutil.rmtree(workDir,ignore_errors=True)
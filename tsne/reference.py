@@ -0,0 +1,260 @@
+"""
+Out-of-sample t-SNE embedding
+
+Keeps a fitted t-SNE embedding frozen, so windows of new data can be
+placed in it without rerunning t-SNE over everything and without the
+layout of the reference windows changing between runs.
+
+A ReferenceEmbedding holds everything that maps raw features of a
+window to the input of the embedding: the per feature mean and std used
+to standardize them (as featextract.standardize), the PCA mean and
+axes from calc_tsne.PCAAxes and the centring and scaling bhtsne.embed
+applies. It also holds the reduced reference points and their
+coordinates and, when given, the symbol and start date of every one of
+those windows, so place() can keep the coordinates of windows that are
+already in the reference instead of placing them again.
+
+New windows go through the same frozen steps, then get the K nearest
+reference points, found with a KD-tree, and input similarities to them
+with the perplexity of the fit, as bhtsne computes them. With
+STEPS = 0 a new window is placed at the similarity-weighted mean of the
+coordinates of those neighbours. Otherwise that is the starting point
+of STEPS gradient steps on the KL divergence between those similarities
+and the Student-t similarities to the same neighbours, which don't
+move. Every new window is placed on its own, so placing one costs the
+same with thousands of others as alone.
+
+HOW TO USE
+    ref = ReferenceEmbedding.fit(raw)      # raw = featextract.compute_windows(...)
+    ref.save('embedding')
+    ...
+    ref = ReferenceEmbedding.load('embedding')
+    Y = ref.transform(new_raw)
+    Y = ref.place(raw, symbol, date)       # keeps known windows in place
+"""
+
+import os
+import json
+import numpy as np
+from scipy.spatial import cKDTree
+import bhtsne
+from calc_tsne import PCAAxes, projectPCA
+
+class ReferenceEmbedding(object):
+
+    def __init__(self, feature_mean, feature_std, pca_mean, pca_axes,
+            center, scale, X, Y, PERPLEX, symbol=None, date=None):
+        self.feature_mean = feature_mean
+        self.feature_std = feature_std
+        self.pca_mean = pca_mean
+        self.pca_axes = pca_axes
+        self.center = center
+        self.scale = scale
+        # reduced reference points and their coordinates
+        self.X = X
+        self.Y = Y
+        self.PERPLEX = PERPLEX
+        # symbol and start date of every reference window, if known
+        self.symbol = symbol
+        self.date = date
+        self.tree = cKDTree(X)
+
+    @classmethod
+    def fit(cls, raw, NO_DIMS=2, PERPLEX=30, INITIAL_DIMS=30, THETA=0.5,
+            MAX_ITER=1000, SEED=None, PCA_METHOD='eigh', symbol=None,
+            date=None):
+        """
+        Embeds the rows of raw, unstandardized features as
+        bhtsne.calc_tsne(featextract.standardize(raw)) does and keeps
+        the result as the reference. symbol and date, the symbol and
+        start date of the window of every row, are needed by place
+        """
+        return cls.freeze(raw, None, INITIAL_DIMS, PCA_METHOD, PERPLEX,
+            NO_DIMS, THETA, MAX_ITER, SEED, symbol, date)
+
+    @classmethod
+    def freeze(cls, raw, Y, INITIAL_DIMS=30, PCA_METHOD='eigh', PERPLEX=30,
+            NO_DIMS=2, THETA=0.5, MAX_ITER=1000, SEED=None, symbol=None,
+            date=None):
+        """
+        Reference from raw features and the coordinates Y that
+        bhtsne.calc_tsne gave their standardized rows with the same
+        INITIAL_DIMS and PCA_METHOD, e.g. the cached or saved result of
+        an earlier run, without running t-SNE again. t-SNE is run when
+        Y is None. raw can be a FeatureMatrix, which is only read a
+        chunk of rows at a time when PCA_METHOD is 'incremental' and
+        loaded whole for the other methods
+        """
+        if hasattr(raw, 'chunks'):
+            # a FeatureMatrix stays on disk, its rows are standardized a
+            # batch at a time as incremental PCA and projectPCA slice
+            # them. The other methods need every row in memory
+            feature_mean, feature_std = _chunked_moments(raw)
+            features = _Standardized(raw, feature_mean, feature_std)
+            if PCA_METHOD != 'incremental':
+                features = features[:]
+        else:
+            raw = np.asarray(raw, dtype=float)
+            feature_mean = raw.mean(axis=0)
+            feature_std = raw.std(axis=0)
+            features = (raw - feature_mean) / feature_std
+
+        pca_mean, pca_axes = PCAAxes(features, INITIAL_DIMS, PCA_METHOD)
+        X = projectPCA(features, pca_mean, pca_axes)
+
+        if Y is None:
+            Y = bhtsne.embed(X, NO_DIMS, PERPLEX, THETA, MAX_ITER, SEED)
+
+        # the normalization bhtsne.embed starts with
+        center = X.mean(axis=0)
+        X = X - center
+        scale = max(np.abs(X).max(), 1e-300)
+        X /= scale
+
+        if symbol is not None:
+            symbol = np.asarray(symbol, dtype=str)
+            date = np.asarray(date, dtype=str)
+        return cls(feature_mean, feature_std, pca_mean, pca_axes, center,
+            scale, X, np.asarray(Y, dtype=float), PERPLEX, symbol, date)
+
+    def __len__(self):
+        return len(self.X)
+
+    def reduce(self, raw):
+        """
+        Rows of raw features mapped through the frozen standardization,
+        PCA and normalization onto the space of the reference points
+        """
+        # standardizing folds into the projection, which then reads raw
+        # a batch of rows at a time, so raw can be a FeatureMatrix
+        mean = self.feature_mean + self.feature_std * self.pca_mean
+        axes = self.pca_axes / self.feature_std[:, None]
+        X = projectPCA(raw, mean, axes)
+        return (X - self.center) / self.scale
+
+    def transform(self, raw, K=None, STEPS=0, LEARNING_RATE=0.5):
+        """
+        Coordinates in the reference embedding of the windows with raw
+        features raw, one row per window. K neighbours are used, 3 times
+        the perplexity by default as in bhtsne
+        """
+        if K is None:
+            K = int(3*self.PERPLEX)
+        K = min(K, len(self))
+        X = self.reduce(raw)
+        if len(X) == 0:
+            return np.empty((0, self.Y.shape[1]))
+
+        dist, ind = self.tree.query(X, K)
+        dist = dist.reshape(len(X), K)
+        ind = ind.reshape(len(X), K)
+        P = bhtsne._conditional_probabilities(dist**2, min(self.PERPLEX, K))
+
+        neighbours = self.Y[ind]
+        Y = (P[:, :, None] * neighbours).sum(axis=1)
+        for step in xrange(STEPS):
+            Y -= LEARNING_RATE * _kl_gradient(P, Y, neighbours)
+        return Y
+
+    def rows_of(self, symbol, date):
+        """
+        Reference row of the window of every given symbol and start
+        date, -1 for windows not in the reference
+        """
+        keys = _keys(symbol, date)
+        if self.symbol is None or len(keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        known = _keys(self.symbol, self.date)
+        order = np.argsort(known, kind='mergesort')
+        pos = np.minimum(np.searchsorted(known[order], keys), len(known) - 1)
+        return np.where(known[order][pos] == keys, order[pos], -1)
+
+    def place(self, raw, symbol, date, K=None, STEPS=0, LEARNING_RATE=0.5):
+        """
+        Coordinates of the windows with raw features raw and the given
+        symbols and start dates. Windows that are in the reference keep
+        their coordinates, the others are placed with transform
+        """
+        rows = self.rows_of(symbol, date)
+        new = np.flatnonzero(rows < 0)
+        Y = np.empty((len(rows), self.Y.shape[1]))
+        Y[rows >= 0] = self.Y[rows[rows >= 0]]
+        if len(new):
+            Y[new] = self.transform(raw[new], K, STEPS, LEARNING_RATE)
+        return Y
+
+    def save(self, path):
+        """
+        Writes the reference to the directory at path
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name in ['feature_mean', 'feature_std', 'pca_mean', 'pca_axes',
+                'center', 'X', 'Y']:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+        if self.symbol is not None:
+            np.save(os.path.join(path, 'symbol.npy'), self.symbol)
+            np.save(os.path.join(path, 'date.npy'), self.date)
+        with open(os.path.join(path, 'meta.json'), 'w') as out:
+            json.dump({'scale': self.scale, 'PERPLEX': self.PERPLEX}, out)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a reference written by save
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, name + '.npy')) for name in
+            ['feature_mean', 'feature_std', 'pca_mean', 'pca_axes', 'center']]
+        keys = [None, None]
+        if os.path.exists(os.path.join(path, 'symbol.npy')):
+            keys = [np.load(os.path.join(path, name + '.npy')) for name in
+                ['symbol', 'date']]
+        return cls(*(arrays + [meta['scale'],
+            np.load(os.path.join(path, 'X.npy')),
+            np.load(os.path.join(path, 'Y.npy')),
+            meta['PERPLEX']] + keys))
+
+class _Standardized(object):
+    # rows of raw standardized with mean and std when sliced. The
+    # statistics are private so that nothing taking this for an array
+    # calls them as its mean() and std()
+
+    def __init__(self, raw, mean, std):
+        self.raw = raw
+        self._mean = mean
+        self._std = std
+        self.shape = raw.shape
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, rows):
+        return (self.raw[rows] - self._mean) / self._std
+
+def _chunked_moments(raw):
+    # mean and std of every column of a FeatureMatrix, from two passes
+    # over its chunks
+    total = np.zeros(raw.shape[1])
+    for a, block in raw.chunks():
+        total += block.sum(axis=0)
+    mean = total / len(raw)
+    m2 = np.zeros(raw.shape[1])
+    for a, block in raw.chunks():
+        m2 += ((block - mean)**2).sum(axis=0)
+    return mean, np.sqrt(m2 / len(raw))
+
+def _keys(symbol, date):
+    # one string per window to match them on
+    return np.char.add(np.char.add(np.asarray(symbol, dtype=str), '/'),
+        np.asarray(date, dtype=str))
+
+def _kl_gradient(P, Y, neighbours):
+    # gradient of sum_j p_j log(p_j / q_j) for every new point y, with
+    # q_j the Student-t similarity of y to its neighbour j normalised
+    # over the neighbours
+    diff = Y[:, None, :] - neighbours
+    w = 1 / (1 + (diff**2).sum(axis=2))
+    Q = w / w.sum(axis=1)[:, None]
+    return 4 * (((P - Q) * w)[:, :, None] * diff).sum(axis=1)
@@ -0,0 +1,181 @@
+"""
+Vantage-point tree for exact k nearest neighbour search
+in euclidean space, used by bhtsne to find the neighbours each
+point's perplexity is calibrated over.
+
+Nodes live in flat arrays. Queries are answered a block of
+points at a time: every block walks the tree once, with each
+node's distance test and each leaf's distances computed for
+the whole block with NumPy, so python overhead is paid per
+block and node rather than per point.
+"""
+
+import numpy as np
+
+class VPTree(object):
+
+    def __init__(self, X, leaf_size=256, seed=0):
+        """
+        Builds the tree over the rows of X
+        """
+        self.X = np.ascontiguousarray(X, dtype=float)
+        self.sqnorms = (self.X**2).sum(axis=1)
+        self.leaf_size = leaf_size
+
+        n = len(self.X)
+        rng = np.random.RandomState(seed)
+
+        # points ordered so every node covers order[lo:hi],
+        # an inner node's vantage point sits at order[lo]
+        self.order = np.arange(n)
+        lo_, hi_, vp_, mu_, inside_, outside_ = [], [], [], [], [], []
+
+        def new_node(lo, hi):
+            lo_.append(lo)
+            hi_.append(hi)
+            vp_.append(-1)
+            mu_.append(0.0)
+            inside_.append(-1)
+            outside_.append(-1)
+            return len(lo_) - 1
+
+        stack = [new_node(0, n)] if n > 0 else []
+        while stack:
+            node = stack.pop()
+            lo, hi = lo_[node], hi_[node]
+            if hi - lo <= leaf_size:
+                continue
+
+            # move a random vantage point to the front of the range
+            pick = lo + rng.randint(hi - lo)
+            order = self.order
+            order[lo], order[pick] = order[pick], order[lo]
+            vp = order[lo]
+
+            # split the rest at the median distance to it
+            rest = order[lo+1:hi]
+            dist = self._distances(self.X[vp][None, :], rest)[0]
+            mid = len(rest) // 2
+            part = np.argpartition(dist, mid)
+            order[lo+1:hi] = rest[part]
+
+            vp_[node] = vp
+            mu_[node] = dist[part[mid]]
+            inside_[node] = new_node(lo + 1, lo + 1 + mid)
+            outside_[node] = new_node(lo + 1 + mid, hi)
+            stack.append(inside_[node])
+            stack.append(outside_[node])
+
+        self.lo = np.array(lo_, dtype=np.int64)
+        self.hi = np.array(hi_, dtype=np.int64)
+        self.vp = np.array(vp_, dtype=np.int64)
+        self.mu = np.array(mu_, dtype=float)
+        self.inside = np.array(inside_, dtype=np.int64)
+        self.outside = np.array(outside_, dtype=np.int64)
+
+    def _distances(self, Q, inds, qnorms=None):
+        # euclidean distances between the rows of Q and X[inds]
+        if qnorms is None:
+            qnorms = (Q**2).sum(axis=1)
+        d2 = (qnorms[:, None] + self.sqnorms[inds][None, :]
+            - 2*np.dot(Q, self.X[inds].T))
+        return np.sqrt(np.maximum(d2, 0))
+
+    def knn(self, k, block_size=256):
+        """
+        Finds the k nearest neighbours of every point in the tree,
+        excluding the point itself.
+        Returns (dist, ind), both n x k and sorted by distance
+        """
+        n = len(self.X)
+        if k >= n:
+            raise Exception(('Cannot find k=', k, ' neighbours among ', n, ' points'))
+
+        dist = np.empty((n, k))
+        ind = np.empty((n, k), dtype=np.int64)
+
+        # tree order keeps neighbouring points together, so each
+        # block's search radius shrinks quickly
+        for start in xrange(0, n, block_size):
+            block = self.order[start:start + block_size]
+            bd, bi = self._search_block(block, k)
+            dist[block] = bd
+            ind[block] = bi
+
+        return dist, ind
+
+    def _search_block(self, block, k):
+        Q = self.X[block]
+        qnorms = self.sqnorms[block]
+        m = len(block)
+
+        best_d = np.full((m, k), np.inf)
+        best_i = np.full((m, k), -1, dtype=np.int64)
+        # search radius of every query, the k-th best distance so far
+        tau = np.full(m, np.inf)
+
+        # entries are (node, queries that may need it, their distances
+        # to the parent's vantage point, the parent's radius, whether
+        # node is the inside child). pruning is decided when an entry
+        # is popped, by which time tau has usually shrunk a lot
+        stack = [(0, np.arange(m), None, 0.0, True)] if len(self.lo) > 0 else []
+        while stack:
+            node, active, d, mu, inside = stack.pop()
+            if d is not None:
+                if inside:
+                    keep = d - tau[active] <= mu
+                else:
+                    keep = d + tau[active] >= mu
+                active = active[keep]
+                if len(active) == 0:
+                    continue
+
+            vp = self.vp[node]
+            if vp < 0:
+                # leaf, compare against every point in it
+                inds = self.order[self.lo[node]:self.hi[node]]
+            else:
+                inds = self.vp[node:node+1]
+
+            cand_d = self._distances(Q[active], inds, qnorms[active])
+            # a point is not its own neighbour
+            own = inds[None, :] == block[active][:, None]
+            self._merge(best_d, best_i, tau, active,
+                np.where(own, np.inf, cand_d), inds)
+
+            if vp < 0:
+                continue
+
+            d = cand_d[:, 0]
+            mu = self.mu[node]
+            # the stack is LIFO, push the more promising child last
+            inner = (self.inside[node], active, d, mu, True)
+            outer = (self.outside[node], active, d, mu, False)
+            if (d < mu).sum() * 2 >= len(active):
+                stack.extend([outer, inner])
+            else:
+                stack.extend([inner, outer])
+
+        order = np.argsort(best_d, axis=1)
+        rows = np.arange(m)[:, None]
+        return best_d[rows, order], best_i[rows, order]
+
+    @staticmethod
+    def _merge(best_d, best_i, tau, active, cand_d, inds):
+        # folds candidate points inds, at distances cand_d from the
+        # active queries, into their k best, updating tau in place
+        improves = (cand_d < tau[active][:, None]).any(axis=1)
+        if not improves.any():
+            return
+        rows = active[improves]
+        cand_d = cand_d[improves]
+
+        k = best_d.shape[1]
+        all_d = np.hstack((best_d[rows], cand_d))
+        all_i = np.hstack((best_i[rows],
+            np.broadcast_to(inds, cand_d.shape)))
+        keep = np.argpartition(all_d, k - 1, axis=1)[:, :k]
+        r = np.arange(len(rows))[:, None]
+        best_d[rows] = all_d[r, keep]
+        best_i[rows] = all_i[r, keep]
+        tau[rows] = best_d[rows].max(axis=1)
@@ -1,34 +1,93 @@
 #!/bin/python2
-import os
 import sys
 import numpy as np
 import cPickle as pkl
+from cStringIO import StringIO
 from matplotlib.pyplot import figure, show
 import matplotlib.gridspec as gridspec
 from featuregenerator import preprocess as pp
-from tsne import calc_tsne as tsne
-
-def run(infile, pklpath, k, l, use_relative_err, max_error=float('inf')):
+from featuregenerator import featextract as fex
+from featuregenerator import stagecache as sc
+from featuregenerator import instrument
+from featuregenerator import segmenter as sgt
+from featuregenerator.segments import Segments, indices_of, values_of
+from tsne import bhtsne
+from tsne import calc_tsne
+import explorer
+
+def run(infile, pklpath, k, l, use_relative_err, max_error=float('inf'),
+        cachedir=None, tracepath=None, traceformat='chrome', method='bottom_up',
+        explore=False):
     if infile.name.endswith('.pkl'):
         print("Using previously computed data from " + infile.name)
         result, data, dates, segd, features, k, l = depickle_interm(infile)
+    elif cachedir != None:
+        print("Generating features from Yahoo Finance CSV file " + infile.name)
+        result, data, dates, segd, features = cached_stages(
+            sc.StageCache(cachedir), infile, k, l, use_relative_err, max_error,
+            method=method)
+
+        if pklpath != None:
+            pickle_interm((result, data, dates, segd, features, k, l), pklpath)
     else:
         print("Generating features from Yahoo Finance CSV file " + infile.name)
         # extract features and segmented data from CSV file
-        features, segd, dates, data = pp.gen_simple_features(infile, k, l, use_relative_err, max_error)
+        features, segd, dates, data = pp.gen_simple_features(infile, k, l, use_relative_err, max_error,
+            method=method)
 
         # convert to numpy 2-D array
         features = np.array(features)
 
         # run tsne
-        tsneLocation = os.path.dirname(os.path.realpath(tsne.__file__)) + "/"
-        result = tsne.calc_tsne(features, folderPrefix = tsneLocation)
+        result = bhtsne.calc_tsne(features)
 
         if pklpath != None:
             pickle_interm((result, data, dates, segd, features, k, l), pklpath)
 
+    if tracepath != None:
+        print("Writing trace to " + tracepath)
+        instrument.write(tracepath, traceformat)
+
     print("Generating plot")
-    interactive_plot(result, segd, dates, data, k, l, features)
+    if explore:
+        explorer.explore(result, segd, dates, data, k, l, features)
+    else:
+        interactive_plot(result, segd, dates, data, k, l, features)
+
+def cached_stages(cache, infile, k, l, use_relative_err, max_error,
+        initial_dims=30, perplexity=30, method='bottom_up'):
+    # each stage is keyed by the previous stage's key and its own
+    # parameters, the first one by the contents of the csv file, read
+    # once since infile may be stdin
+    text = infile.read()
+    key = sc.stage_key('parse', sc.bytes_digest(text))
+    def parse():
+        dates, data = pp.csv_import(StringIO(text))
+        return {'dates': np.array(dates), 'data': np.array(data)}
+    series = cache.cached('parse', key, parse)
+    dates = series['dates'].tolist()
+    data = series['data'].tolist()
+
+    key = sc.stage_key('segment', key, k, use_relative_err, max_error, method)
+    def segment():
+        segd = pp.segment(data, k, use_relative_err, max_error, method)
+        return {'indices': segd.indices, 'values': segd.values}
+    segs = cache.cached('segment', key, segment)
+    segd = Segments(segs['indices'], segs['values'])
+
+    key = sc.stage_key('features', key, l)
+    features = cache.cached('features', key,
+        lambda: {'features': fex.extract_features(segd, l)})['features']
+
+    key = sc.stage_key('pca', key, initial_dims)
+    reduced = cache.cached('pca', key,
+        lambda: {'reduced': calc_tsne.PCA(features, initial_dims)})['reduced']
+
+    key = sc.stage_key('tsne', key, perplexity)
+    result = cache.cached('tsne', key,
+        lambda: {'result': bhtsne.embed(reduced, PERPLEX=perplexity)})['result']
+
+    return result, data, dates, segd, features
 
 def pickle_interm(data, pklpath):
     # Format: data, dates, segd, features, k, l
@@ -64,7 +123,8 @@ def interactive_plot(result, segd, dates, data, seglength, windowlength, feature
         ind = event.ind[np.random.randint(0,len(event.ind))]
         print(features[ind])
         seg = segd[ind: ind + windowlength]
-        seg_inds, seg_vals = zip(*seg)
+        seg_inds = indices_of(seg)
+        seg_vals = values_of(seg)
         seg_dates = [dates[i] for i in seg_inds]
 
         # highlight it
@@ -119,6 +179,10 @@ if __name__ == '__main__':
         action='store_true',
         default=False,
         help='ALG. PARAM: Use relative residuals for segmentation')
+    aparser.add_argument('-s', dest='segmenter',
+        choices=sorted(sgt.SEGMENTERS),
+        default='bottom_up',
+        help='ALG. PARAM: Segmentation algorithm')
     aparser.add_argument('-o', dest='storeLoc', 
         type=str,
         default=None,
@@ -128,6 +192,23 @@ if __name__ == '__main__':
         default=float('inf'),
         help='Maximum allowed square residual during SEGMENTATION process')
 
+    aparser.add_argument('-c', dest='cacheDir', 
+        type=str,
+        default=None,
+        help='Optional directory to cache every stage in, reruns only redo stages whose parameters changed')
+    aparser.add_argument('-t', dest='traceFile', 
+        type=str,
+        default=None,
+        help='Optional location to write stage timings and counters to as JSON')
+    aparser.add_argument('-f', dest='traceFormat', 
+        choices=['chrome', 'summary'],
+        default='chrome',
+        help='Format of the -t output, a Chrome trace or per stage totals')
+    aparser.add_argument('-x', dest='explore',
+        action='store_true',
+        default=False,
+        help='Use the explorer, which draws a density image until zoomed in, for large embeddings')
+
     args = aparser.parse_args()
     k = args.segmentLength
     l = args.windowLength
@@ -136,7 +217,12 @@ if __name__ == '__main__':
         aparser.print_usage()
         sys.exit("ERROR: -k and -l must be specified if input file is not .pkl")
 
+    if args.traceFile != None:
+        instrument.enable()
+
     try:
-        run(args.inputFile, args.storeLoc,  k, l, args.use_relative_err, args.maxerror)
+        run(args.inputFile, args.storeLoc,  k, l, args.use_relative_err, args.maxerror,
+            args.cacheDir, args.traceFile, args.traceFormat, args.segmenter,
+            args.explore)
     finally:
         args.inputFile.close()
\ No newline at end of file